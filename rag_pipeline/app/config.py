@@ -7,15 +7,31 @@ HF_TOKEN = os.getenv("HUGGINGFACEHUB_API_TOKEN", "")
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
 
-if not HF_TOKEN:
-    raise RuntimeError("HUGGINGFACEHUB_API_TOKEN is not set (put in .env)")
-
 DEFAULT_TOP_K = int(os.getenv("GEN_TOP_K", "5"))
 MAX_CONTEXT_CHARS = int(os.getenv("MAX_CONTEXT_CHARS", "12000"))
 
+# Startup warm-up (see app/lifecycle.py); /ready answers 200 once it finishes
+PRELOAD_ON_STARTUP = os.getenv("PRELOAD_ON_STARTUP", "1") == "1"
+WARMUP_QUERIES = [q.strip() for q in os.getenv(
+    "WARMUP_QUERIES",
+    "groovy script to set message headers|xslt mapping from idoc to json|"
+    "iflow with sftp sender and odata receiver|externalized properties for http adapter",
+).split("|") if q.strip()]
+WARMUP_MIN_ROUNDS = int(os.getenv("WARMUP_MIN_ROUNDS", "2"))
+WARMUP_MAX_ROUNDS = int(os.getenv("WARMUP_MAX_ROUNDS", "8"))
+# steady once a round's p99 is within this fraction of the previous round's
+WARMUP_TOLERANCE = float(os.getenv("WARMUP_TOLERANCE", "0.15"))
+
 SUPPORTED_MODELS = {
     "mistral": "mistralai/Mistral-7B-Instruct-v0.3",
     "zephyr": "HuggingFaceH4/zephyr-7b-beta",
 }
 
 
+def require_hf_token() -> str:
+    # Checked when an LLM is built, not at import, so the API can start (and serve retrieval) without it
+    if not HF_TOKEN:
+        raise RuntimeError("HUGGINGFACEHUB_API_TOKEN is not set (put in .env)")
+    return HF_TOKEN
+
+
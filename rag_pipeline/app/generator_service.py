@@ -1,12 +1,13 @@
 from typing import List, Optional
 from .llm_router import make_hf_llm_from_key, choose_model_for_query
-from .prompts import PROMPTS
 from .utils import build_context_from_items, extract_artifacts, detect_query_type
 from .models import SearchResultItem
 from .validation import validate_xml, validate_properties
 
 
 def generate_from_selected(query: str, selected_items: List[SearchResultItem], model_key: Optional[str] = None):
+    from .prompts import PROMPTS
+
     qtype = detect_query_type(query)
     model_id = choose_model_for_query(qtype, override_key=model_key)
     llm = make_hf_llm_from_key(model_key or "mistral")
@@ -4,7 +4,6 @@ Handles structured queries and relationship discovery for SAP iFlow components
 """
 import os
 from typing import List, Dict, Any, Optional
-from neo4j import GraphDatabase
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -27,6 +26,8 @@ class KnowledgeGraphService:
     def connect(self):
         """Initialize connection to Neo4j"""
         try:
+            from neo4j import GraphDatabase
+
             self.driver = GraphDatabase.driver(
                 self.uri,
                 auth=(self.username, self.password)
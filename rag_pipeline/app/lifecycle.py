@@ -0,0 +1,81 @@
+"""
+Startup lifecycle for the retrieval stack: background preload, warm-up inferences and readiness state
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from .config import PRELOAD_ON_STARTUP, WARMUP_QUERIES, WARMUP_MIN_ROUNDS, WARMUP_MAX_ROUNDS, WARMUP_TOLERANCE
+from .retriever_service import load_retriever, close_retriever
+
+
+_lock = threading.Lock()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_state: Dict[str, Any] = {"status": "starting", "error": None, "rounds": [], "steady": False}
+
+
+def _set(**fields) -> None:
+    with _lock:
+        _state.update(fields)
+
+
+def _p99(latencies: List[float]) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+
+
+def _warm_up() -> None:
+    started = time.perf_counter()
+    try:
+        _set(status="loading")
+        print("🔥 Preloading retrieval stack (models, Supabase client, corpus)...")
+        rs = load_retriever()
+        _set(status="warming", load_s=round(time.perf_counter() - started, 2))
+
+        # Repeat the warm-up queries until the round p99 stops moving
+        previous = None
+        for _ in range(WARMUP_MAX_ROUNDS):
+            if _stop.is_set() or not WARMUP_QUERIES:
+                break
+            p99 = _p99(rs.warm_up(WARMUP_QUERIES))
+            with _lock:
+                _state["rounds"].append(round(p99, 1))
+                rounds = len(_state["rounds"])
+            print(f"🔥 Warm-up round {rounds}: p99 {p99:.1f}ms")
+            if previous is not None and rounds >= WARMUP_MIN_ROUNDS and abs(p99 - previous) <= WARMUP_TOLERANCE * previous:
+                _set(steady=True)
+                break
+            previous = p99
+        _set(status="ready", ready_s=round(time.perf_counter() - started, 2))
+        print(f"✅ Retrieval stack ready after {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(f"❌ Warm-up failed: {e}")
+        _set(status="failed", error=str(e))
+
+
+def start_warmup() -> None:
+    """Preload and warm up in a background thread; the API answers /health meanwhile"""
+    global _thread
+    if not PRELOAD_ON_STARTUP:
+        # Loaded on the first request instead
+        _set(status="ready")
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_warm_up, name="retriever-warmup", daemon=True)
+    _thread.start()
+
+
+def stop_warmup(timeout: float = 10.0) -> None:
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
+    close_retriever()
+    _set(status="stopped")
+
+
+def readiness() -> Dict[str, Any]:
+    with _lock:
+        state = dict(_state)
+        state["rounds"] = list(_state["rounds"])
+    state["ready"] = state["status"] == "ready"
+    return state
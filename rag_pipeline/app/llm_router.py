@@ -1,5 +1,4 @@
-from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
-from .config import HF_TOKEN, SUPPORTED_MODELS
+from .config import SUPPORTED_MODELS, require_hf_token
 
 
 CHAT_HINT_KEYS = {"mistral"}
@@ -11,6 +10,9 @@ def _is_chat_model(model_id: str) -> bool:
 
 
 def make_hf_llm_from_key(key: str):
+    from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
+
+    token = require_hf_token()
     model_id = SUPPORTED_MODELS.get(key, key)
     try:
         if _is_chat_model(model_id):
@@ -19,7 +21,7 @@ def make_hf_llm_from_key(key: str):
                 task="conversational",
                 max_new_tokens=1024,
                 temperature=0.2,
-                huggingfacehub_api_token=HF_TOKEN,
+                huggingfacehub_api_token=token,
             )
             return ChatHuggingFace(llm=client)
     except Exception:
@@ -30,7 +32,7 @@ def make_hf_llm_from_key(key: str):
         task="text-generation",
         max_new_tokens=1024,
         temperature=0.2,
-        huggingfacehub_api_token=HF_TOKEN,
+        huggingfacehub_api_token=token,
     )
 
 
@@ -1,8 +1,20 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from .routes import router
+from .lifecycle import start_warmup, stop_warmup, readiness
 
-app = FastAPI(title="Unified iFlow Retrieval+Generation API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models and corpus load in the background; /health answers right away, /ready once warm
+    start_warmup()
+    yield
+    stop_warmup()
+
+
+app = FastAPI(title="Unified iFlow Retrieval+Generation API", lifespan=lifespan)
 
 # Add CORS middleware for frontend connection
 app.add_middleware(
@@ -26,3 +38,7 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
@@ -16,6 +16,8 @@ class RerankConfig(BaseModel):
     enabled: bool = True
     model: Optional[str] = "cross-encoder"
     weight_vector: Optional[Dict[str, float]] = None
+    # most candidates to cross-encode for this request (None = server default)
+    max_depth: Optional[int] = None
 
 
 class HybridConfig(BaseModel):
@@ -27,12 +27,12 @@ class RetrievalSystem:
         self.real_system = RealRetrievalSystem()
         print("✅ Real retrieval system initialized successfully!")
 
-    def search(self, query: str, top_k: int = 5, apply_reranking: bool = True):
+    def search(self, query: str, top_k: int = 5, apply_reranking: bool = True, rerank_depth: int = None):
         """
         Search using the real Person 2's retrieval system
         """
         print(f"🔍 Search: '{query}' (top_k={top_k})")
-        result = self.real_system.search(query, top_k=top_k, apply_reranking=apply_reranking)
+        result = self.real_system.search(query, top_k=top_k, apply_reranking=apply_reranking, rerank_depth=rerank_depth)
 
         # Log basic result info
         if isinstance(result, dict):
@@ -41,6 +41,13 @@ class RetrievalSystem:
 
         return result
 
+    def search_many(self, queries: list, top_k: int = 5, apply_reranking: bool = True, rerank_depth: int = None):
+        """
+        Batch search: one embedding pass and one corpus scoring pass for all queries
+        """
+        print(f"🔍 Batch search: {len(queries)} queries (top_k={top_k})")
+        return self.real_system.search_many(queries, top_k=top_k, apply_reranking=apply_reranking, rerank_depth=rerank_depth)
+
     def record_feedback(self, query: str, document_id: str, sentiment: str, score: float = 1.0):
         """
         Record feedback using the real Person 2's retrieval system
@@ -48,5 +55,17 @@ class RetrievalSystem:
         print(f"� Feedback recorded: {sentiment} (score: {score})")
         return self.real_system.record_feedback(query, document_id, sentiment, score)
 
+    def warm_up(self, queries: list, top_k: int = 5):
+        """
+        Warm-up pass over the real system; returns per-query latencies in ms
+        """
+        return self.real_system.warm_up(queries, top_k=top_k)
+
+    def close(self):
+        """
+        Stop background workers (embedding batcher, search shards) of the real system
+        """
+        self.real_system.close()
+
 
 __all__ = ["RetrievalSystem"]
\ No newline at end of file
@@ -1,25 +1,50 @@
+import threading
 from typing import List, Dict, Any
 from .models import SearchResultItem
 from .config import DEFAULT_TOP_K
 
-# Import Person-2 retrieval system
-from .p2.application.app import RetrievalSystem
-
 
 _retriever = None
+_retriever_lock = threading.Lock()
 
 
-def get_retriever():
+def load_retriever():
+    """
+    Build the retrieval stack (CodeBERT, cross-encoder, Supabase client, corpus).
+    torch / transformers / sentence-transformers are first imported here, not when the API module loads.
+    """
     global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            # Import Person-2 retrieval system
+            from .p2.application.app import RetrievalSystem
+
+            _retriever = RetrievalSystem()
+    return _retriever
+
+
+def get_retriever():
     if _retriever is None:
-        _retriever = RetrievalSystem()
+        return load_retriever()
     return _retriever
 
 
-def search_query(query: str, top_k: int = None) -> Dict[str, Any]:
+def is_retriever_loaded() -> bool:
+    return _retriever is not None
+
+
+def close_retriever() -> None:
+    global _retriever
+    with _retriever_lock:
+        rs, _retriever = _retriever, None
+    if rs is not None:
+        rs.close()
+
+
+def search_query(query: str, top_k: int = None, rerank_depth: int = None) -> Dict[str, Any]:
     rs = get_retriever()
     top_k = top_k or DEFAULT_TOP_K
-    res = rs.search(query, top_k=top_k, apply_reranking=True)
+    res = rs.search(query, top_k=top_k, apply_reranking=True, rerank_depth=rerank_depth)
     items = []
     for d in res.get("results", []):
         items.append(SearchResultItem(
@@ -34,7 +59,8 @@ def search_query(query: str, top_k: int = None) -> Dict[str, Any]:
         "query": query,
         "results": items,
         "total_candidates": res.get("total_candidates", 0),
-        "reranking_applied": res.get("reranking_applied", False)
+        "reranking_applied": res.get("reranking_applied", False),
+        "rerank_depth": res.get("rerank_depth")
     }
 
 
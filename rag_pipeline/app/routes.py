@@ -72,8 +72,10 @@ def api_search(payload: SearchRequest):
 
     # Apply reranking based on frontend config
     apply_reranking = True
+    rerank_depth = None
     if payload.rerank:
         apply_reranking = payload.rerank.enabled
+        rerank_depth = payload.rerank.max_depth
 
     # Clear component type filters since real data doesn't have them
     if payload.filters and payload.filters.component_types:
@@ -81,7 +83,7 @@ def api_search(payload: SearchRequest):
 
     try:
         # Call backend search
-        res = search_query(payload.query, top_k=top_k)
+        res = search_query(payload.query, top_k=top_k, rerank_depth=rerank_depth)
 
         # Apply client-side filtering if filters are provided
         filtered_results = res["results"]
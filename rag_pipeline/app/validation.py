@@ -1,7 +1,6 @@
-from lxml import etree
-
-
 def validate_xml(text: str) -> bool:
+    from lxml import etree
+
     try:
         etree.fromstring(text.encode("utf-8"))
         return True
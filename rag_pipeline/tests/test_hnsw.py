@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Stable-label bookkeeping of the retrieval system's HNSW index
+(retrieval.hnsw.HnswIndex): upsert, delete and re-insert of the same id,
+resizing, and label -> row maps of older snapshots.
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add paths
+current_dir = Path(__file__).parent
+retrieval_src = current_dir.parent.parent / "retrival sys (cobert)" / "src"
+sys.path.insert(0, str(retrieval_src))
+
+pytest.importorskip("hnswlib")
+
+from retrieval.hnsw import HnswIndex
+
+DIM = 16
+
+
+def _unit(i):
+    v = np.zeros(DIM, dtype=np.float32)
+    v[i % DIM] = 1.0
+    return v
+
+
+def _corpus(ids):
+    return np.stack([_unit(i) for i in ids]), [{"id": i} for i in ids]
+
+
+def _top_ids(index, meta, rows, q, k=1):
+    found, _ = index.search(q, k, rows)
+    return [meta[int(r)]["id"] for r in found]
+
+
+def test_upsert_delete_and_reinsert_same_id():
+    mat, meta = _corpus(range(8))
+    index = HnswIndex.build(mat, meta)
+    rows = index.rows_for(meta)
+    assert _top_ids(index, meta, rows, _unit(3)) == [3]
+
+    # update in place: id 3 moves to another vector, its label stays
+    label = index.label_of[3]
+    index.upsert([3], _unit(12)[None, :])
+    assert index.label_of[3] == label
+    assert _top_ids(index, meta, rows, _unit(12)) == [3]
+
+    index.remove([3])
+    assert index.live == 7
+    assert 3 not in _top_ids(index, meta, rows, _unit(12), k=8)
+    # deleting twice is a no-op
+    index.remove([3])
+    assert index.live == 7
+
+    # re-inserting un-deletes the same label rather than allocating a new one
+    index.upsert([3], _unit(3)[None, :])
+    assert index.label_of[3] == label
+    assert len(index.ids) == 8
+    assert index.live == 8
+    assert _top_ids(index, meta, rows, _unit(3)) == [3]
+
+
+def test_rows_for_after_deletes():
+    mat, meta = _corpus(range(6))
+    index = HnswIndex.build(mat, meta)
+    index.remove([1, 4])
+    kept = [m for m in meta if m["id"] not in (1, 4)]
+    rows = index.rows_for(kept)
+    assert rows[index.label_of[1]] == -1
+    assert rows[index.label_of[4]] == -1
+    assert [kept[int(rows[index.label_of[i]])]["id"] for i in (0, 2, 3, 5)] == [0, 2, 3, 5]
+    found, _ = index.search(_unit(2), 6, rows)
+    assert sorted(kept[int(r)]["id"] for r in found) == [0, 2, 3, 5]
+
+
+def test_resize_and_labels_newer_than_snapshot():
+    mat, meta = _corpus(range(4))
+    index = HnswIndex(DIM, capacity=4)
+    index.upsert([m["id"] for m in meta], mat)
+    old_rows = index.rows_for(meta)
+
+    # grows past the initial capacity
+    new_ids = list(range(100, 110))
+    index.upsert(new_ids, np.stack([_unit(i) for i in new_ids]))
+    assert index.index.get_max_elements() >= 14
+    assert index.live == 14
+
+    # an older snapshot's label map has no row for the new labels: they are filtered out
+    found, _ = index.search(_unit(100), 14, old_rows)
+    assert sorted(meta[int(r)]["id"] for r in found) == [0, 1, 2, 3]
+    for found, _ in index.search_many(np.stack([_unit(100), _unit(1)]), 14, old_rows):
+        assert sorted(meta[int(r)]["id"] for r in found) == [0, 1, 2, 3]
+
+    new_meta = meta + [{"id": i} for i in new_ids]
+    assert _top_ids(index, new_meta, index.rows_for(new_meta), _unit(100)) == [100]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime parity: the onnx / onnx-int8 backends of the retrieval system
+against eager PyTorch, for the CodeBERT embedder and the cross-encoder.
+Thresholds are the ones in retrieval/onnx_backend.py. Skipped when
+onnxruntime is not installed or the models cannot be loaded (offline).
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add paths
+current_dir = Path(__file__).parent
+retrieval_src = current_dir.parent.parent / "retrival sys (cobert)" / "src"
+sys.path.insert(0, str(retrieval_src))
+
+pytest.importorskip("onnxruntime")
+
+from config import settings
+from retrieval.onnx_backend import PARITY_MAX_SCORE_DIFF, PARITY_MIN_COSINE, PARITY_MIN_SPEARMAN
+
+# PARITY_CROSS_ENCODER / PARITY_EMBEDDING_MODEL point the test at other (e.g. local) models
+CROSS_ENCODER = os.getenv("PARITY_CROSS_ENCODER", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+EMBEDDING_MODEL = os.getenv("PARITY_EMBEDDING_MODEL", settings.model_name)
+
+QUERIES = [
+    "read a property from the message header",
+    "XSLT mapping for the order payload",
+    "groovy script to log the request body",
+]
+
+DOCUMENTS = [
+    "def props = message.getProperties(); def value = props.get(\"SAPClient\"); message.setProperty(\"client\", value)",
+    "<xsl:template match=\"/Order\"><Invoice><xsl:value-of select=\"OrderID\"/></Invoice></xsl:template>",
+    "import com.sap.gateway.ip.core.customdev.util.Message\ndef Message processData(Message message) {\n    def body = message.getBody(String)\n    messageLog.addAttachmentAsString(\"payload\", body, \"text/plain\")\n    return message\n}",
+    "<property><key>SenderEndpoint</key><value>/orders</value></property>",
+    "def headers = message.getHeaders(); headers.each { k, v -> log.info(\"${k}=${v}\") }",
+    "SELECT id, content FROM documents ORDER BY embedding <=> $1 LIMIT 10",
+    "<wsdl:operation name=\"CreateOrder\"><wsdl:input message=\"tns:OrderRequest\"/></wsdl:operation>",
+    "message.setHeader(\"Content-Type\", \"application/json\")",
+    "def json = new groovy.json.JsonSlurper().parseText(body); json.items.each { it.price = it.price * 1.2 }",
+    "<xsl:for-each select=\"Items/Item\"><Line><xsl:value-of select=\"Quantity\"/></Line></xsl:for-each>",
+]
+
+
+def _spearman(a: np.ndarray, b: np.ndarray) -> float:
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+@pytest.fixture(autouse=True)
+def onnx_dir(monkeypatch):
+    # exported graphs go to a scratch directory; ONNX_DIR keeps a persistent one
+    with tempfile.TemporaryDirectory() as tmp:
+        monkeypatch.setattr(settings, "onnx_dir", os.getenv("ONNX_DIR") or tmp)
+        yield
+
+
+def _load(factory):
+    try:
+        return factory()
+    except OSError as exc:
+        pytest.skip(f"model not available: {exc}")
+
+
+def test_cross_encoder_parity():
+    from rerank.rerank import CrossEncoderScoreCache, CrossEncoderScorer
+
+    def scorer(backend):
+        cache = CrossEncoderScoreCache(CROSS_ENCODER, max_entries=0)
+        return _load(lambda: CrossEncoderScorer(CROSS_ENCODER, cache=cache, backend=backend))
+
+    pairs = [[(q, d) for d in DOCUMENTS] for q in QUERIES]
+    reference = [np.array(s) for s in map(scorer("torch").predict, pairs)]
+    for backend in ("onnx", "onnx-int8"):
+        scores = [np.array(s) for s in map(scorer(backend).predict, pairs)]
+        rho = min(_spearman(s, r) for s, r in zip(scores, reference))
+        diff = max(float(np.abs(s - r).max()) for s, r in zip(scores, reference))
+        print(f"cross-encoder {backend}: spearman min {rho:.6f}, max |diff| {diff:.6f}")
+        assert rho >= PARITY_MIN_SPEARMAN[backend], f"{backend} spearman {rho:.6f} < {PARITY_MIN_SPEARMAN[backend]}"
+        if backend in PARITY_MAX_SCORE_DIFF:
+            assert diff <= PARITY_MAX_SCORE_DIFF[backend], f"{backend} max |diff| {diff:.6f} > {PARITY_MAX_SCORE_DIFF[backend]}"
+
+
+def test_embedder_parity():
+    from retrieval.embedder import CodeBERTEmbedder
+    from retrieval.vectors import l2_normalize
+
+    def embed(backend):
+        embedder = _load(lambda: CodeBERTEmbedder(model_name=EMBEDDING_MODEL, device="cpu", backend=backend))
+        return l2_normalize(embedder.embed(QUERIES + DOCUMENTS).numpy())
+
+    reference = embed("torch")
+    for backend in ("onnx", "onnx-int8"):
+        cos = float((embed(backend) * reference).sum(axis=1).min())
+        print(f"embedder {backend}: min cosine {cos:.6f}")
+        assert cos >= PARITY_MIN_COSINE[backend], f"{backend} min cosine {cos:.6f} < {PARITY_MIN_COSINE[backend]}"
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
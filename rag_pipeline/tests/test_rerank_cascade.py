@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Cascade reranking in the retrieval system (rerank.rerank.CrossEncoderScorer.score_cascade)
+with a stub predictor: the depth widens only while the top-k boundary is
+unstable, max_depth / RERANK_MAX_DEPTH is respected, and CascadeStats counts it.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add paths
+current_dir = Path(__file__).parent
+retrieval_src = current_dir.parent.parent / "retrival sys (cobert)" / "src"
+sys.path.insert(0, str(retrieval_src))
+
+from config import settings
+from rerank.rerank import CascadeStats, CrossEncoderScoreCache, CrossEncoderScorer
+
+K = 2
+
+
+@pytest.fixture(autouse=True)
+def cascade_settings(monkeypatch):
+    for name, value in {
+        "rerank_cascade": True,
+        "rerank_initial_depth": 4,
+        "rerank_step": 2,
+        "rerank_margin": 1.0,
+        "rerank_max_depth": 0,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+
+
+def _scorer(logits):
+    """A CrossEncoderScorer whose model returns `logits[i]` for text "doc i"; the calls are kept in `.scored`."""
+    scorer = CrossEncoderScorer.__new__(CrossEncoderScorer)
+    scorer.cache = CrossEncoderScoreCache("stub", max_entries=0)
+    scorer.cascade_stats = CascadeStats()
+    scorer.scored = []
+
+    def predict(pairs, batch_tokens=None):
+        scorer.scored.extend(t for _, t in pairs)
+        return [float(logits[int(t.split()[1])]) for _, t in pairs]
+
+    scorer.predict = predict
+    return scorer
+
+
+def _texts(n):
+    return [f"doc {i}" for i in range(n)]
+
+
+def test_stable_boundary_stops_at_initial_depth():
+    scorer = _scorer([9, 8, 1, 1, 0, 0, 0, 0, 0, 0])
+    scores, depth = scorer.score_cascade("q", _texts(10), K)
+    assert depth == 4
+    assert scores[:4] == [9, 8, 1, 1]
+    assert scores[4:] == [None] * 6
+    assert scorer.scored == _texts(4)
+    stats = scorer.cascade_stats.stats()
+    assert (stats["stopped_early"], stats["capped"], stats["pairs_scored"]) == (1, 0, 4)
+
+
+def test_close_scores_widen_until_the_boundary_settles():
+    # doc 3 comes within the margin of the 2nd best, so one more step is scored; docs 4-5 do not
+    scorer = _scorer([9, 8, 1, 7.5, 1, 1, 0, 0, 0, 0])
+    scores, depth = scorer.score_cascade("q", _texts(10), K)
+    assert depth == 6
+    assert scorer.scored == _texts(6)
+    assert scorer.cascade_stats.stopped_early == 1
+
+
+def test_unstable_boundary_scores_everything():
+    scorer = _scorer([5] * 10)
+    scores, depth = scorer.score_cascade("q", _texts(10), K)
+    assert depth == 10
+    assert None not in scores
+    # all candidates scored: neither an early stop nor the cap
+    assert (scorer.cascade_stats.stopped_early, scorer.cascade_stats.capped) == (0, 0)
+
+
+def test_max_depth_is_respected(monkeypatch):
+    scorer = _scorer([5] * 10)
+    scores, depth = scorer.score_cascade("q", _texts(10), K, max_depth=5)
+    assert depth == 5
+    assert len(scorer.scored) == 5
+    assert scores[5:] == [None] * 5
+
+    # RERANK_MAX_DEPTH is the default cap
+    monkeypatch.setattr(settings, "rerank_max_depth", 6)
+    _, depth = scorer.score_cascade("q", _texts(10), K)
+    assert depth == 6
+
+    # a cap below the initial depth wins over it
+    _, depth = scorer.score_cascade("q", _texts(10), K, max_depth=3)
+    assert depth == 3
+
+    stats = scorer.cascade_stats.stats()
+    assert stats["requests"] == 3
+    assert stats["capped"] == 3
+    assert stats["pairs_scored"] == 5 + 6 + 3
+    assert stats["candidates"] == 30
+    assert stats["depth"]["max"] == 6
+
+
+def test_cascade_off_scores_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(settings, "rerank_cascade", False)
+    scorer = _scorer([9, 8, 0, 0, 0, 0, 0, 0, 0, 0])
+    _, depth = scorer.score_cascade("q", _texts(10), K)
+    assert depth == 10
+    _, depth = scorer.score_cascade("q", _texts(10), K, max_depth=4)
+    assert depth == 4
+    assert scorer.cascade_stats.capped == 0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: import time of app.main in a fresh interpreter.
+Fails when the median exceeds IMPORT_BUDGET_S or when a heavy ML / client
+library is imported before the first request needs it.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+APP_ROOT = Path(__file__).parent.parent
+IMPORT_BUDGET_S = float(os.getenv("IMPORT_BUDGET_S", "3.0"))
+RUNS = int(os.getenv("IMPORT_RUNS", "3"))
+
+# Only the service accessors (get_retriever, generate_from_selected, ...) may pull these in
+HEAVY_MODULES = (
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "langchain",
+    "langchain_huggingface",
+    "neo4j",
+    "supabase",
+)
+
+_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - t
+heavy = [m for m in %r if m in sys.modules]
+print(json.dumps({"seconds": elapsed, "heavy": heavy}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_import() -> dict:
+    env = dict(os.environ)
+    # config must not require the HF token at import
+    env.pop("HUGGINGFACEHUB_API_TOKEN", None)
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=APP_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_import_budget():
+    runs = [measure_import() for _ in range(RUNS)]
+    median = statistics.median(r["seconds"] for r in runs)
+    heavy = sorted({m for r in runs for m in r["heavy"]})
+    print(f"app.main import: median {median:.3f}s over {RUNS} runs (budget {IMPORT_BUDGET_S:.1f}s)")
+    assert not heavy, f"imported at startup: {', '.join(heavy)}"
+    assert median <= IMPORT_BUDGET_S, f"app.main import took {median:.3f}s (budget {IMPORT_BUDGET_S:.1f}s)"
+
+
+if __name__ == "__main__":
+    test_import_budget()
+    print("✅ Startup import budget met")
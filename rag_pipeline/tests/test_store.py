@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Resident corpus delta sync (retrieval.store.CorpusStore) against an in-memory
+fake of the Supabase table: upserts, inserts, soft and hard deletes, the
+watermark, and the snapshot swap.
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add paths
+current_dir = Path(__file__).parent
+retrieval_src = current_dir.parent.parent / "retrival sys (cobert)" / "src"
+sys.path.insert(0, str(retrieval_src))
+
+from config import settings
+from retrieval.scan import blocked_topk
+from retrieval.store import CorpusStore
+
+DIM = 8
+
+
+class FakeQuery:
+    """The subset of the postgrest query builder that CorpusStore and BulkLoader use."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.columns = []
+        self.filters = []
+        self.order_by = None
+        self.desc = False
+        self.bounds = None
+        self.max_rows = None
+
+    def select(self, columns, count=None):
+        self.columns = columns.split(",")
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda r: r.get(column) is not None and r[column] > value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda r: r.get(column) is not None and r[column] <= value)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by, self.desc = column, desc
+        return self
+
+    def limit(self, n):
+        self.max_rows = n
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end + 1)
+        return self
+
+    def execute(self):
+        rows = [r for r in self.rows if all(f(r) for f in self.filters)]
+        if self.order_by:
+            rows.sort(key=lambda r: r[self.order_by], reverse=self.desc)
+        if self.bounds:
+            rows = rows[self.bounds[0]:self.bounds[1]]
+        if self.max_rows is not None:
+            rows = rows[:self.max_rows]
+        data = [{c: r.get(c) for c in self.columns} for r in rows]
+        return type("Response", (), {"data": data})()
+
+
+class FakeClient:
+    def __init__(self):
+        self.rows = []
+
+    def table(self, name):
+        return FakeQuery(self.rows)
+
+    def put(self, doc_id, vector, updated_at, deleted=False):
+        self.rows[:] = [r for r in self.rows if r["id"] != doc_id]
+        self.rows.append({
+            "id": doc_id,
+            "content": f"doc {doc_id}",
+            "embedding": list(map(float, vector)),
+            "updated_at": updated_at,
+            "deleted": deleted,
+        })
+
+
+def _unit(i):
+    v = np.zeros(DIM, dtype=np.float32)
+    v[i % DIM] = 1.0
+    return v
+
+
+@pytest.fixture(autouse=True)
+def store_settings(monkeypatch):
+    for name, value in {
+        "embed_cache": "",
+        "shared_corpus": False,
+        "search_mode": "exact",
+        "sync_column": "updated_at",
+        "deleted_column": "deleted",
+        "sync_prune_every": 0,
+        "sync_compact_interval": 600.0,
+        "load_workers": 1,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+
+
+@pytest.fixture
+def client():
+    c = FakeClient()
+    for i in range(1, 6):
+        c.put(i, _unit(i), updated_at=1)
+    return c
+
+
+def _ids(snap):
+    return sorted(m["id"] for m in snap.meta)
+
+
+def _top(snap, q):
+    idx, _ = blocked_topk(snap.matrix, np.asarray(q, dtype=np.float32), 1)
+    return snap.meta[int(idx[0])]["id"]
+
+
+def test_upsert_insert_and_soft_delete(client):
+    store = CorpusStore(client)
+    before = store.snapshot()
+    assert _ids(before) == [1, 2, 3, 4, 5]
+    assert before.watermark == 1
+
+    client.put(2, _unit(6) * 3, updated_at=2)  # existing id, new vector (normalized on load)
+    client.put(6, _unit(7), updated_at=2)  # new id
+    client.put(3, _unit(3), updated_at=2, deleted=True)  # soft delete
+    after = store.sync()
+
+    assert _ids(after) == [1, 2, 4, 5, 6]
+    assert after.version == before.version + 1
+    assert after.watermark == 2
+    row = [m["id"] for m in after.meta].index(2)
+    assert np.allclose(np.asarray(after.matrix[row]), _unit(6))
+    assert _top(after, _unit(6)) == 2
+    assert _top(after, _unit(7)) == 6
+    # the previous snapshot is untouched; searches in flight keep scoring it
+    assert _ids(before) == [1, 2, 3, 4, 5]
+    assert _top(before, _unit(3)) == 3
+
+
+def test_watermark_limits_what_is_reread(client):
+    store = CorpusStore(client)
+    store.snapshot()
+    assert store.sync().version == 1
+    assert store.sync_status()["last_sync_changes"] == 0
+
+    # an edit that does not advance the sync column is not picked up
+    client.put(4, _unit(7), updated_at=1)
+    client.put(5, _unit(6), updated_at=3)
+    snap = store.sync()
+    assert snap.watermark == 3
+    assert store.sync_status()["last_sync_changes"] == 1
+    assert _top(snap, _unit(6)) == 5
+    assert _top(snap, _unit(4)) == 4
+
+
+def test_prune_drops_hard_deleted_rows(client, monkeypatch):
+    store = CorpusStore(client)
+    store.snapshot()
+    client.rows[:] = [r for r in client.rows if r["id"] != 1]
+    assert _ids(store.sync()) == [1, 2, 3, 4, 5]
+
+    monkeypatch.setattr(settings, "sync_prune_every", 1)
+    snap = store.sync()
+    assert _ids(snap) == [2, 3, 4, 5]
+    assert _top(snap, _unit(1)) != 1
+
+
+def test_segments_merge_on_compaction(client, monkeypatch):
+    store = CorpusStore(client)
+    store.snapshot()
+    client.put(6, _unit(6), updated_at=2)
+    assert type(store.sync().matrix).__name__ == "SegmentedMatrix"
+
+    # no cache configured: compaction merges the segments in memory
+    monkeypatch.setattr(settings, "sync_compact_interval", 0.0)
+    client.put(7, _unit(7), updated_at=3)
+    snap = store.sync()
+    assert isinstance(snap.matrix, np.ndarray)
+    assert _ids(snap) == [1, 2, 3, 4, 5, 6, 7]
+    assert _top(snap, _unit(7)) == 7
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
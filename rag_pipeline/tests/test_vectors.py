@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Embedding column decoding: corpus width and the rows skipped as wrong_dim
+"""
+import sys
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+# Add paths
+current_dir = Path(__file__).parent
+retrieval_src = current_dir.parent.parent / "retrival sys (cobert)" / "src"
+sys.path.insert(0, str(retrieval_src))
+
+from retrieval import vectors
+from retrieval.vectors import decode_vectors
+
+
+def test_short_first_row_does_not_set_width():
+    mat, ok, stats = decode_vectors(["[1,2]"] + ["[1,2,3]"] * 5)
+    assert mat.shape == (5, 3)
+    assert ok.tolist() == [False] + [True] * 5
+    assert stats.wrong_dim == 1
+    assert stats.decoded == 5
+
+
+def test_majority_width_across_formats():
+    values = [[1.0, 2.0], "{1,2,3}", np.array([4.0, 5.0, 6.0]), "[7,8,9]", None]
+    mat, ok, stats = decode_vectors(values)
+    assert mat.shape == (3, 3)
+    assert ok.tolist() == [False, True, True, True, False]
+    assert stats.wrong_dim == 1
+    assert stats.missing == 1
+
+
+def test_explicit_dim_wins():
+    mat, ok, stats = decode_vectors(["[1,2]"] + ["[1,2,3]"] * 5, dim=2)
+    assert mat.shape == (1, 2)
+    assert stats.wrong_dim == 5
+
+
+def test_malformed_and_wrong_width_rows_are_skipped():
+    mat, ok, stats = decode_vectors(["[1,2,3]", "[1,2,x]", "[4,5,6]", "[1,2]"])
+    assert mat.tolist() == [[1, 2, 3], [4, 5, 6]]
+    assert ok.tolist() == [True, False, True, False]
+    assert stats.malformed == 1
+    assert stats.wrong_dim == 1
+
+
+def test_malformed_row_when_numpy_only_warns():
+    # numpy < 2 returns a partial parse with a DeprecationWarning instead of raising
+    fromstring = np.fromstring
+
+    def warning_fromstring(text, dtype, sep):
+        if "x" in text:
+            warnings.warn("string or file could not be read to its end", DeprecationWarning)
+            return np.array([1.0, 2.0])
+        return fromstring(text, dtype=dtype, sep=sep)
+
+    vectors.np.fromstring = warning_fromstring
+    try:
+        mat, ok, stats = decode_vectors(["[1,2,3]", "[1,2,x]", "[4,5,6]"])
+    finally:
+        vectors.np.fromstring = fromstring
+    assert mat.tolist() == [[1, 2, 3], [4, 5, 6]]
+    assert ok.tolist() == [True, False, True]
+    assert stats.malformed == 1
+
+
+if __name__ == "__main__":
+    test_short_first_row_does_not_set_width()
+    test_majority_width_across_formats()
+    test_explicit_dim_wins()
+    test_malformed_and_wrong_width_rows_are_skipped()
+    test_malformed_row_when_numpy_only_warns()
+    print("✅ Embedding decoding tests passed")
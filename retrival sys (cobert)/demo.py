@@ -29,6 +29,7 @@ def print_help():
     print("  status   - Show system status")
     print("  tables   - Show available database tables")
     print("  load     - Load sample data")
+    print("  refresh  - Reload the in-memory corpus from Supabase")
     print("  quit     - Exit the demo")
     print("  [query]  - Ask a question about iFlow components")
 
@@ -122,6 +123,13 @@ def interactive_demo():
             if user_input.lower() == 'load':
                 load_sample_data(system)
                 continue
+            if user_input.lower() == 'refresh':
+                result = system.refresh_corpus()
+                if result.get('success'):
+                    print(f" Corpus reloaded: {result['documents']} documents (version {result['corpus_version']})")
+                else:
+                    print(f" Refresh failed: {result.get('error', 'Unknown error')}")
+                continue
             print(f"\n Searching for: '{user_input}'")
             print("\U0001F4DA Against database documents")
             print(" Please wait...")
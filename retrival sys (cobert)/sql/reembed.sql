@@ -0,0 +1,67 @@
+-- Bulk vector write-back for src/reembed.py.
+--   psql "$DATABASE_URL" -f sql/reembed.sql   (or paste into the Supabase SQL editor)
+--
+-- Updates only the vector column of rows that still exist, keyed by id: rows deleted while the job
+-- runs stay deleted and concurrent content edits are not overwritten. `vectors` are pgvector text
+-- ("[1,2,3]"); they are cast to the column's type (vector, float8[]/real[] or text).
+-- Returns the number of rows updated.
+--
+-- The function can write any table, so only the service role may call it: run src/reembed.py with
+-- SUPABASE_KEY set to the service_role key. The anon and authenticated keys get a permission error.
+
+CREATE OR REPLACE FUNCTION set_embeddings(
+    table_name text,
+    id_column text,
+    vector_column text,
+    ids text[],
+    vectors text[]
+) RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    id_type text;
+    column_type text;
+    value_expr text := 'v.vec';
+    updated integer;
+BEGIN
+    SELECT format_type(a.atttypid, a.atttypmod) INTO id_type
+    FROM pg_attribute a
+    WHERE a.attrelid = quote_ident(table_name)::regclass AND a.attname = id_column AND NOT a.attisdropped;
+    IF id_type IS NULL THEN
+        RAISE EXCEPTION 'column %.% does not exist', table_name, id_column;
+    END IF;
+    SELECT format_type(a.atttypid, a.atttypmod) INTO column_type
+    FROM pg_attribute a
+    WHERE a.attrelid = quote_ident(table_name)::regclass AND a.attname = vector_column AND NOT a.attisdropped;
+    IF column_type IS NULL THEN
+        RAISE EXCEPTION 'column %.% does not exist', table_name, vector_column;
+    END IF;
+    IF column_type LIKE '%[]' THEN
+        value_expr := 'translate(v.vec, ''[]'', ''{}'')';
+    END IF;
+    -- ids are cast to the id column's type rather than the column to text, so the primary-key index is used
+    EXECUTE format(
+        'UPDATE %I AS t SET %I = (%s)::%s FROM unnest($1, $2) AS v(id, vec) WHERE t.%I = v.id::%s',
+        table_name, vector_column, value_expr, column_type, id_column, id_type
+    ) USING ids, vectors;
+    GET DIAGNOSTICS updated = ROW_COUNT;
+    RETURN updated;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION set_embeddings(text, text, text, text[], text[]) FROM PUBLIC;
+-- Supabase exposes functions to these roles through PostgREST; plain Postgres does not have them
+DO $$
+DECLARE
+    r text;
+BEGIN
+    FOREACH r IN ARRAY ARRAY['anon', 'authenticated'] LOOP
+        IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = r) THEN
+            EXECUTE format('REVOKE EXECUTE ON FUNCTION set_embeddings(text, text, text, text[], text[]) FROM %I', r);
+        END IF;
+    END LOOP;
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'service_role') THEN
+        GRANT EXECUTE ON FUNCTION set_embeddings(text, text, text, text[], text[]) TO service_role;
+    END IF;
+END;
+$$;
@@ -2,6 +2,7 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 import re
+import time
 
 from retrieval.search import Retriever, SearchResult
 from rerank.feedback import FeedbackStore
@@ -50,8 +51,49 @@ class RetrievalSystem:
         return {
             "feedback_stats": {"entries": len(self.feedback.id_scores) + len(self.feedback.content_scores)},
             "table": self.table_name,
+            "search_backend": self.retriever.backend,
+            "corpus_version": self.retriever.store.version if self.retriever.store is not None else None,
+            "corpus_sync": self.retriever.store.sync_status() if self.retriever.store is not None else None,
+            "query_cache": self.retriever.embedder.query_cache.stats(),
+            "embed_batching": self.retriever.embedder.batcher.stats() if self.retriever.embedder.batcher else None,
+            "cross_encoder_cache": self.cross_encoder.cache.stats(),
+            "rerank_cascade": self.cross_encoder.cascade_stats.stats(),
         }
 
+    def close(self) -> None:
+        self.retriever.close()
+        if self.retriever.embedder.batcher is not None:
+            self.retriever.embedder.batcher.close(timeout=5)
+        self.cross_encoder.cache.save()
+
+    def warm_up(self, queries: List[str], top_k: int = 5) -> List[float]:
+        """Run `queries` through search (and once through search_many) so lazy model/kernel setup happens before traffic.
+
+        Returns per-query search latencies in ms. The cross-encoder score cache is bypassed, so
+        every round measures the model rather than cache hits and no warm-up pairs are persisted.
+        The query cache is cleared afterwards, so the next pass (and real traffic) embeds instead
+        of hitting warm-up entries.
+        """
+        latencies: List[float] = []
+        with self.cross_encoder.cache.bypassed():
+            for query in queries:
+                started = time.perf_counter()
+                self.search(query, top_k=top_k)
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            self.search_many(queries, top_k=top_k)
+        self.retriever.embedder.query_cache.clear()
+        return latencies
+
+    def refresh_corpus(self) -> Dict[str, Any]:
+        if self.retriever.store is None:
+            # pgvector mode reads the table on every query, so there is nothing to reload
+            return {"success": True, "corpus_version": None, "documents": None, "search_backend": self.retriever.backend}
+        try:
+            version = self.retriever.refresh()
+            return {"success": True, "corpus_version": version, "documents": len(self.retriever.store.snapshot())}
+        except Exception as exc:
+            return {"success": False, "error": str(exc)}
+
     def load_sample_data(self) -> Dict[str, Any]:
         try:
             info = self.get_table_info()
@@ -61,11 +103,35 @@ class RetrievalSystem:
         except Exception as exc:
             return {"success": False, "error": str(exc)}
 
-    def search(self, query: str, document: Optional[str] = None, top_k: Optional[int] = None, apply_reranking: bool = True) -> Dict[str, Any]:
+    def search(
+        self,
+        query: str,
+        document: Optional[str] = None,
+        top_k: Optional[int] = None,
+        apply_reranking: bool = True,
+        rerank_depth: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """`rerank_depth` caps how many candidates this request may cross-encode (default RERANK_MAX_DEPTH)."""
         k = top_k or self.top_k
         candidate_k = max(k * 5, 50)
-        temp_retriever = Retriever(top_k=candidate_k)
-        results: List[SearchResult] = temp_retriever.search(query)
+        results: List[SearchResult] = self.retriever.search(query, top_k=candidate_k)
+        return self._rank_candidates(query, results, k, apply_reranking, rerank_depth)
+
+    def search_many(
+        self,
+        queries: List[str],
+        top_k: Optional[int] = None,
+        apply_reranking: bool = True,
+        rerank_depth: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        k = top_k or self.top_k
+        candidate_k = max(k * 5, 50)
+        batches = self.retriever.search_many(queries, top_k=candidate_k)
+        return [self._rank_candidates(q, results, k, apply_reranking, rerank_depth) for q, results in zip(queries, batches)]
+
+    def _rank_candidates(
+        self, query: str, results: List[SearchResult], k: int, apply_reranking: bool, rerank_depth: Optional[int] = None
+    ) -> Dict[str, Any]:
         if not results:
             return {
                 "results": [],
@@ -73,8 +139,10 @@ class RetrievalSystem:
                 "reranking_applied": False,
                 "vector_search_available": True,
             }
+        # Cascade: cross-encode top candidates by similarity, deeper only while it keeps paying off
+        raw, depth = self.cross_encoder.score_cascade(query, [r.content for r in results], k, rerank_depth)
         reranked = rerank_with_feedback(
-            results, user_id="demo-user", feedback=self.feedback, query_text=query, cross_encoder=self.cross_encoder
+            results, user_id="demo-user", feedback=self.feedback, query_text=query, raw_cross_scores=raw
         )
         dedup: Dict[str, Dict[str, Any]] = {}
         for r in reranked:
@@ -118,6 +186,7 @@ class RetrievalSystem:
             "results": ordered[:k],
             "total_candidates": len(results),
             "reranking_applied": apply_reranking,
+            "rerank_depth": depth,
             "vector_search_available": True,
         }
 
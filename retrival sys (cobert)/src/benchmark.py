@@ -0,0 +1,370 @@
+import argparse
+import time
+from typing import Callable, List, Tuple
+import numpy as np
+from config import settings
+from retrieval.vectors import l2_normalize
+
+
+def load_matrix(args) -> np.ndarray:
+    if args.synthetic:
+        # Clustered vectors behave more like real embeddings than isotropic noise
+        rng = np.random.default_rng(args.seed)
+        centers = rng.standard_normal((max(args.synthetic // 200, 8), args.dim)).astype(np.float32)
+        assign = rng.integers(0, centers.shape[0], args.synthetic)
+        mat = centers[assign] + 0.6 * rng.standard_normal((args.synthetic, args.dim)).astype(np.float32)
+        return l2_normalize(mat).astype(np.float32)
+    from retrieval import cache as corpus_cache
+    cached = corpus_cache.load_corpus()
+    if cached is None:
+        raise SystemExit(f"No usable corpus cache at {settings.embed_cache}; run a search once or pass --synthetic N")
+    return cached[0]
+
+
+def make_queries(mat: np.ndarray, n: int, seed: int) -> np.ndarray:
+    # Perturbed corpus rows: realistic neighbourhoods without needing CodeBERT
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, mat.shape[0], n)
+    noisy = np.asarray(mat[picks]) + 0.05 * rng.standard_normal((n, mat.shape[1])).astype(np.float32)
+    return l2_normalize(noisy).astype(np.float32)
+
+
+def exact_topk(mat: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    sims = mat @ q
+    return np.argsort(-sims)[:k]
+
+
+def recall_at_k(truth: List[np.ndarray], found: List[np.ndarray]) -> float:
+    hits = sum(len(set(t.tolist()) & set(f.tolist())) for t, f in zip(truth, found))
+    return hits / max(sum(len(t) for t in truth), 1)
+
+
+def timed(fn: Callable[[np.ndarray], np.ndarray], queries: np.ndarray) -> Tuple[List[np.ndarray], np.ndarray]:
+    out: List[np.ndarray] = []
+    lat = np.zeros(len(queries))
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        out.append(np.asarray(fn(q)))
+        lat[i] = (time.perf_counter() - t0) * 1000.0
+    return out, lat
+
+
+def report(name: str, lat: np.ndarray, recall: float, extra: str = "") -> None:
+    print(
+        f"{name:<22} recall@k={recall:.4f}  p50={np.percentile(lat, 50):8.3f} ms  "
+        f"p95={np.percentile(lat, 95):8.3f} ms  qps={1000.0 / max(lat.mean(), 1e-9):9.1f}  {extra}"
+    )
+
+
+def bench_ann(args) -> None:
+    from retrieval.hnsw import HnswIndex
+
+    mat = np.ascontiguousarray(load_matrix(args))
+    queries = make_queries(mat, args.queries, args.seed)
+    print(f"corpus={mat.shape[0]} dim={mat.shape[1]} queries={len(queries)} k={args.k}")
+    truth, lat = timed(lambda q: exact_topk(mat, q, args.k), queries)
+    report("exact", lat, 1.0)
+
+    meta = [{"id": i} for i in range(mat.shape[0])]
+    t0 = time.perf_counter()
+    index = HnswIndex.build(mat, meta, m=args.m, ef_construction=args.ef_construction)
+    print(f"hnsw build: {time.perf_counter() - t0:.2f} s (M={index.m}, ef_construction={index.ef_construction})")
+    rows = index.rows_for(meta)
+    for ef in args.ef_search:
+        index.set_ef(ef)
+        found, lat = timed(lambda q: index.search(q, args.k, rows)[0], queries)
+        report(f"hnsw ef_search={ef}", lat, recall_at_k(truth, found))
+
+
+def bench_quant(args) -> None:
+    from retrieval.quantize import QuantizedMatrix
+
+    mat = np.ascontiguousarray(load_matrix(args))
+    queries = make_queries(mat, args.queries, args.seed)
+    print(f"corpus={mat.shape[0]} dim={mat.shape[1]} queries={len(queries)} k={args.k} float32={mat.nbytes / 2**20:.1f} MiB")
+    truth, lat = timed(lambda q: exact_topk(mat, q, args.k), queries)
+    report("exact", lat, 1.0)
+    variants = []
+    for kind in args.kinds:
+        if kind == "pca":
+            variants.extend((f"pca{d}", kind, {"dim": d}) for d in args.pca_dim)
+        else:
+            variants.append((kind, kind, {}))
+    for name, kind, fit_args in variants:
+        t0 = time.perf_counter()
+        qm = QuantizedMatrix.build(kind, mat, **fit_args)
+        built = time.perf_counter() - t0
+        size = f"codes={qm.nbytes / 2**20:.1f} MiB ({mat.nbytes / max(qm.nbytes, 1):.1f}x smaller) build={built:.2f} s"
+        # first pass alone, then with exact re-scoring of the top candidates
+        scan, lat = timed(lambda q: np.argsort(-qm.quantizer.scores(qm.codes, q))[: args.k], queries)
+        report(f"{name} scan only", lat, recall_at_k(truth, scan), size)
+        for r in args.rescore:
+            found, lat = timed(lambda q: qm.search(q, args.k, mat, rescore=r)[0], queries)
+            report(f"{name} rescore={r}", lat, recall_at_k(truth, found))
+
+
+def bench_scan(args) -> None:
+    import tracemalloc
+    from retrieval.scan import blocked_topk
+
+    mat = load_matrix(args)
+    queries = make_queries(mat, args.queries, args.seed)
+    print(f"corpus={mat.shape[0]} dim={mat.shape[1]} queries={len(queries)} k={args.k} float32={mat.nbytes / 2**20:.1f} MiB")
+
+    def peak(fn: Callable[[np.ndarray], np.ndarray]) -> float:
+        tracemalloc.start()
+        fn(queries[0])
+        _, top = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return top / 2**20
+
+    truth, lat = timed(lambda q: exact_topk(mat, q, args.k), queries)
+    report("full argsort", lat, 1.0, f"peak={peak(lambda q: exact_topk(mat, q, args.k)):.2f} MiB")
+    for rows in args.block_rows:
+        fn = lambda q: blocked_topk(mat, q, args.k, block_rows=rows)[0]
+        found, lat = timed(fn, queries)
+        report(f"blocked rows={rows}", lat, recall_at_k(truth, found), f"peak={peak(fn):.2f} MiB")
+
+
+def bench_batch(args) -> None:
+    from retrieval.scan import blocked_topk, blocked_topk_many
+
+    mat = load_matrix(args)
+    queries = make_queries(mat, args.queries, args.seed)
+    print(f"corpus={mat.shape[0]} dim={mat.shape[1]} queries={len(queries)} k={args.k}")
+    t0 = time.perf_counter()
+    truth = [blocked_topk(mat, q, args.k)[0] for q in queries]
+    seq = time.perf_counter() - t0
+    print(f"{'sequential':<22} {seq * 1000:9.1f} ms total  {len(queries) / seq:9.1f} queries/s")
+    for size in args.batch_size:
+        t0 = time.perf_counter()
+        found: List[np.ndarray] = []
+        for start in range(0, len(queries), size):
+            found.extend(blocked_topk_many(mat, queries[start:start + size], args.k)[0])
+        took = time.perf_counter() - t0
+        print(
+            f"{f'batched size={size}':<22} {took * 1000:9.1f} ms total  {len(queries) / took:9.1f} queries/s  "
+            f"recall@k={recall_at_k(truth, found):.4f}"
+        )
+
+
+def bench_shards(args) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+    from retrieval.scan import blocked_topk
+    from retrieval.shards import ShardPool
+
+    mat = np.ascontiguousarray(load_matrix(args))
+    queries = make_queries(mat, args.queries, args.seed)
+    print(f"corpus={mat.shape[0]} dim={mat.shape[1]} queries={len(queries)} k={args.k} clients={args.clients}")
+
+    def throughput(fn: Callable[[np.ndarray], np.ndarray]) -> Tuple[List[np.ndarray], float]:
+        # Concurrent callers, like request threads in the API
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            found = list(pool.map(fn, queries))
+        return found, len(queries) / (time.perf_counter() - t0)
+
+    truth, qps = throughput(lambda q: blocked_topk(mat, q, args.k)[0])
+    print(f"{'in-process':<22} {qps:9.1f} queries/s")
+    for n in args.shards:
+        pool = ShardPool(n)
+        try:
+            pool.load(mat, version=1)
+            found, qps = throughput(lambda q: pool.search(q, args.k, 1)[0])
+            print(f"{f'shards={n}':<22} {qps:9.1f} queries/s  recall@k={recall_at_k(truth, found):.4f}")
+        finally:
+            pool.close()
+
+
+def sample_texts(n: int, seed: int, max_words: int = 200) -> List[str]:
+    # Code-like snippets of mixed length; cached corpus contents are used when available
+    try:
+        from retrieval import cache as corpus_cache
+        cached = corpus_cache.load_corpus()
+    except Exception:
+        cached = None
+    if cached is not None and len(cached[1]) > 0:
+        meta = cached[1]
+        rng = np.random.default_rng(seed)
+        return [meta[int(i)]["content"] for i in rng.integers(0, len(meta), n)]
+    words = "def return class import self for in if else data list map file user query search index cache vector get set".split()
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(words, size=int(rng.integers(4, max_words)))) for _ in range(n)]
+
+
+def bench_embed(args) -> None:
+    import torch
+    from retrieval.embedder import CodeBERTEmbedder
+    from retrieval.onnx_backend import PARITY_MIN_COSINE
+
+    texts = sample_texts(max(args.batch_size) * args.repeats, args.seed)
+    print(f"model={settings.model_name} texts={len(texts)} max_length={settings.max_length} threads={torch.get_num_threads()}")
+    reference = None
+    for backend in args.backends:
+        t0 = time.perf_counter()
+        embedder = CodeBERTEmbedder(device="cpu", backend=backend)
+        print(f"{backend}: loaded in {time.perf_counter() - t0:.1f} s")
+        vectors = l2_normalize(embedder.embed(texts).numpy())
+        if reference is None:
+            reference = vectors
+        else:
+            cos = (vectors * reference).sum(axis=1)
+            floor = PARITY_MIN_COSINE.get(backend)
+            verdict = "" if floor is None else ("  PASS" if cos.min() >= floor else "  FAIL") + f" (>= {floor})"
+            print(f"  cosine vs {args.backends[0]}: min={cos.min():.6f} mean={cos.mean():.6f}{verdict}")
+        for size in args.batch_size:
+            lat = []
+            for start in range(0, size * args.repeats, size):
+                t0 = time.perf_counter()
+                embedder.embed(texts[start:start + size])
+                lat.append((time.perf_counter() - t0) * 1000.0)
+            lat = np.array(lat)
+            print(
+                f"  batch={size:<4} p50={np.percentile(lat, 50):9.1f} ms  p95={np.percentile(lat, 95):9.1f} ms  "
+                f"{size * 1000.0 / lat.mean():8.1f} texts/s"
+            )
+
+
+def _spearman(a: np.ndarray, b: np.ndarray) -> float:
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def bench_rerank(args) -> None:
+    import torch
+    from rerank.rerank import DEFAULT_CROSS_ENCODER, CrossEncoderScoreCache, CrossEncoderScorer
+    from retrieval.onnx_backend import PARITY_MAX_SCORE_DIFF, PARITY_MIN_SPEARMAN
+
+    model_name = args.model or DEFAULT_CROSS_ENCODER
+    candidates = max(args.candidates)
+    texts = sample_texts(candidates * args.repeats, args.seed, args.max_words)
+    # each query is a short slice of one of its candidates
+    queries = [" ".join(texts[i * candidates].split()[:8]) for i in range(args.repeats)]
+    print(f"model={model_name} queries={len(queries)} candidates={args.candidates} threads={torch.get_num_threads()}")
+    reference = None
+    for backend in args.backends:
+        t0 = time.perf_counter()
+        # a disabled cache, so every pair reaches the model
+        scorer = CrossEncoderScorer(model_name, cache=CrossEncoderScoreCache(model_name, max_entries=0), backend=backend)
+        print(f"{backend}: loaded in {time.perf_counter() - t0:.1f} s")
+        by_budget = {
+            budget: [
+                np.array(scorer.predict([(q, t) for t in texts[i * candidates:(i + 1) * candidates]], batch_tokens=budget))
+                for i, q in enumerate(queries)
+            ]
+            for budget in args.batch_tokens
+        }
+        scores = by_budget[args.batch_tokens[0]]
+        for budget in args.batch_tokens[1:]:
+            diff = max(float(np.abs(s - r).max()) for s, r in zip(by_budget[budget], scores))
+            print(f"  batch_tokens={budget} vs {args.batch_tokens[0]}: max |diff|={diff:.6f}")
+        if reference is None:
+            reference = scores
+        else:
+            rho = np.array([_spearman(s, r) for s, r in zip(scores, reference)])
+            diff = max(float(np.abs(s - r).max()) for s, r in zip(scores, reference))
+            floor = PARITY_MIN_SPEARMAN.get(backend)
+            ceiling = PARITY_MAX_SCORE_DIFF.get(backend)
+            passed = (floor is None or rho.min() >= floor) and (ceiling is None or diff <= ceiling)
+            limits = ", ".join(
+                ([f"spearman >= {floor}"] if floor is not None else []) + ([f"|diff| <= {ceiling}"] if ceiling is not None else [])
+            )
+            verdict = f"  {'PASS' if passed else 'FAIL'} ({limits})" if limits else ""
+            print(f"  vs {args.backends[0]}: max |diff|={diff:.6f}  spearman min={rho.min():.6f} mean={rho.mean():.6f}{verdict}")
+        for budget in args.batch_tokens:
+            for n in args.candidates:
+                lat = []
+                for i, q in enumerate(queries):
+                    pairs = [(q, t) for t in texts[i * candidates:i * candidates + n]]
+                    t0 = time.perf_counter()
+                    scorer.predict(pairs, batch_tokens=budget)
+                    lat.append((time.perf_counter() - t0) * 1000.0)
+                lat = np.array(lat)
+                print(
+                    f"  batch_tokens={budget:<6} candidates={n:<4} p50={np.percentile(lat, 50):9.1f} ms  "
+                    f"p95={np.percentile(lat, 95):9.1f} ms  {n * 1000.0 / lat.mean():8.1f} pairs/s"
+                )
+
+
+def bench_corpus(args) -> None:
+    from retrieval.embedder import CodeBERTEmbedder
+
+    texts = sample_texts(args.docs, args.seed)
+    embedder = CodeBERTEmbedder(device="cpu")
+    print(f"model={settings.model_name} backend={embedder.backend} docs={len(texts)} max_length={settings.max_length}")
+    t0 = time.perf_counter()
+    naive = np.concatenate([embedder.embed(texts[i:i + args.batch_size]).numpy() for i in range(0, len(texts), args.batch_size)])
+    took = time.perf_counter() - t0
+    print(f"{f'input order, batch={args.batch_size}':<32} {took:8.1f} s  {len(texts) / took:8.1f} docs/s")
+    for budget in args.batch_tokens:
+        bucketed = embedder.embed_corpus(texts, batch_tokens=budget)
+        stats = embedder.corpus_stats
+        cos = (l2_normalize(bucketed) * l2_normalize(naive)).sum(axis=1)
+        print(
+            f"{f'length-sorted, tokens={budget}':<32} {stats['seconds']:8.1f} s  {stats['docs_per_s']:8.1f} docs/s  "
+            f"padding_efficiency={stats['padding_efficiency']:.2f}  min cosine vs input order={cos.min():.6f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency benchmarks for the retrieval engines")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic clustered vectors instead of the corpus cache")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ann = sub.add_parser("ann", help="Exact vs HNSW search")
+    ann.add_argument("--m", type=int, default=settings.hnsw_m)
+    ann.add_argument("--ef-construction", type=int, default=settings.hnsw_ef_construction)
+    ann.add_argument("--ef-search", type=int, nargs="+", default=[settings.hnsw_ef_search, 128, 256])
+    ann.set_defaults(func=bench_ann)
+
+    quant = sub.add_parser("quant", help="Exact vs int8 / product-quantized / PCA-projected / binary scan with float re-scoring")
+    quant.add_argument("--kinds", nargs="+", default=["int8", "pq", "pca", "binary"], choices=["int8", "pq", "pca", "binary"])
+    quant.add_argument("--pca-dim", type=int, nargs="+", default=[128, 256], help="Components kept for --kinds pca")
+    quant.add_argument("--rescore", type=int, nargs="+", default=[settings.rescore_candidates, 500])
+    quant.set_defaults(func=bench_quant)
+
+    scan = sub.add_parser("scan", help="Full-array argsort vs block-streamed exact top-k")
+    scan.add_argument("--block-rows", type=int, nargs="+", default=[4096, settings.scan_block_rows, 65536])
+    scan.set_defaults(func=bench_scan)
+
+    batch = sub.add_parser("batch", help="One query at a time vs batched matrix-matrix scoring")
+    batch.add_argument("--batch-size", type=int, nargs="+", default=[8, 32, 128])
+    batch.set_defaults(func=bench_batch)
+
+    shards = sub.add_parser("shards", help="In-process exact scan vs scatter-gather over N shard processes")
+    shards.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    shards.add_argument("--clients", type=int, default=8, help="Concurrent query threads")
+    shards.set_defaults(func=bench_shards)
+
+    embed = sub.add_parser("embed", help="CodeBERT latency and embedding parity: torch vs ONNX Runtime (fp32 / int8)")
+    embed.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"], choices=["torch", "onnx", "onnx-int8"])
+    embed.add_argument("--batch-size", type=int, nargs="+", default=[1, 8, 32])
+    embed.add_argument("--repeats", type=int, default=5)
+    embed.set_defaults(func=bench_embed)
+
+    rerank = sub.add_parser("rerank", help="Cross-encoder throughput and score parity: torch vs ONNX Runtime (fp32 / int8)")
+    rerank.add_argument("--model", default=None, help="Cross-encoder model (default: the one RetrievalSystem uses)")
+    rerank.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"], choices=["torch", "onnx", "onnx-int8"])
+    rerank.add_argument("--candidates", type=int, nargs="+", default=[20, 50, 100], help="Pairs scored per query")
+    rerank.add_argument("--repeats", type=int, default=5, help="Queries per candidate count")
+    rerank.add_argument("--batch-tokens", type=int, nargs="+", default=[0, settings.rerank_batch_tokens], help="0 = input order, 32 pairs per batch")
+    rerank.add_argument("--max-words", type=int, default=200, help="Longest synthetic candidate, in words")
+    rerank.set_defaults(func=bench_rerank)
+
+    corpus = sub.add_parser("corpus", help="Bulk document embedding: fixed batches in input order vs length-sorted token budget")
+    corpus.add_argument("--docs", type=int, default=256)
+    corpus.add_argument("--batch-size", type=int, default=32)
+    corpus.add_argument("--batch-tokens", type=int, nargs="+", default=[settings.embed_batch_tokens])
+    corpus.set_defaults(func=bench_corpus)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
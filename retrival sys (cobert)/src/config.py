@@ -13,14 +13,81 @@ class Settings:
     model_name: str = os.getenv("EMBEDDING_MODEL", "microsoft/codebert-base")
     max_length: int = int(os.getenv("MAX_LENGTH", "256"))
     device: str = os.getenv("DEVICE", "cuda" if os.getenv("CUDA", "1") == "1" else "cpu")
+    # "torch" (eager PyTorch), "onnx" (ONNX Runtime, fp32) or "onnx-int8" (dynamic int8 quantized); ONNX runs on CPU
+    embedding_backend: str = os.getenv("EMBEDDING_BACKEND", "torch")
+    onnx_dir: str = os.getenv("ONNX_DIR", "data/onnx")
+    onnx_threads: int = int(os.getenv("ONNX_THREADS", "0"))
+    # query embedding cache (0 entries disables it; 0 ttl never expires)
+    query_cache_size: int = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+    query_cache_ttl: float = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+    query_cache_casefold: bool = os.getenv("QUERY_CACHE_CASEFOLD", "1") == "1"
+    # cross-encoder runtime, same choices as EMBEDDING_BACKEND (ONNX graphs also go under ONNX_DIR)
+    cross_encoder_backend: str = os.getenv("CROSS_ENCODER_BACKEND", "torch")
+    # cross-encoder batches: texts cut to the model window, pairs sorted by length and grouped up to this many padded
+    # tokens per forward pass (0 = input order, 32 pairs per batch, texts as they are)
+    rerank_batch_tokens: int = int(os.getenv("RERANK_BATCH_TOKENS", "8192"))
+    # cross-encoder logits cached per (query, content) pair (0 entries disables it); CE_CACHE_PATH="" keeps it in memory only
+    ce_cache_size: int = int(os.getenv("CE_CACHE_SIZE", "100000"))
+    ce_cache_path: str = os.getenv("CE_CACHE_PATH", "data/cache/cross_encoder_scores.npz")
+    # cascade reranking: cross-encode the top max(RERANK_INITIAL_DEPTH, 2k) candidates by similarity, then RERANK_STEP
+    # more at a time while the deepest RERANK_STEP scored still come within RERANK_MARGIN logits of the k-th best
+    rerank_cascade: bool = os.getenv("RERANK_CASCADE", "1") == "1"
+    rerank_initial_depth: int = int(os.getenv("RERANK_INITIAL_DEPTH", "20"))
+    rerank_step: int = int(os.getenv("RERANK_STEP", "10"))
+    rerank_margin: float = float(os.getenv("RERANK_MARGIN", "1.0"))
+    # most candidates cross-encoded per request (0 = all retrieved); search(rerank_depth=) sets it per call
+    rerank_max_depth: int = int(os.getenv("RERANK_MAX_DEPTH", "0"))
+    # micro-batching of concurrent query embeddings: wait up to the window (or max batch) before a forward pass
+    embed_batch_window_ms: float = float(os.getenv("EMBED_BATCH_WINDOW_MS", "3"))
+    embed_max_batch: int = int(os.getenv("EMBED_MAX_BATCH", "32"))
+    # bulk corpus embedding: padded tokens per forward pass (batch size x longest member)
+    embed_batch_tokens: int = int(os.getenv("EMBED_BATCH_TOKENS", "8192"))
     # Supabase table config (read-only)
     table_name: str = os.getenv("TABLE_NAME", "documents")
     vector_column: str = os.getenv("VECTOR_COLUMN", "embedding")
     content_column: str = os.getenv("CONTENT_COLUMN", "content")
     id_column: str = os.getenv("ID_COLUMN", "id")
+    # corpus delta sync: rows with sync_column > watermark are re-read (defaults to id_column)
+    sync_column: str = os.getenv("SYNC_COLUMN", "")
+    deleted_column: str = os.getenv("DELETED_COLUMN", "")
+    sync_interval: float = float(os.getenv("SYNC_INTERVAL", "0"))
+    # every N delta syncs, scan the id column to drop hard-deleted rows (0 = never)
+    sync_prune_every: int = int(os.getenv("SYNC_PRUNE_EVERY", "10"))
+    # delta syncs keep changed rows in a small in-memory segment over the resident matrix; the segments are
+    # merged and the cache rewritten at most this often (seconds), and after a prune that dropped rows
+    sync_compact_interval: float = float(os.getenv("SYNC_COMPACT_INTERVAL", "600"))
+    # full loads: concurrent keyset-paginated readers over id ranges, and rows per request
+    load_workers: int = int(os.getenv("LOAD_WORKERS", "4"))
+    load_page_size: int = int(os.getenv("LOAD_PAGE_SIZE", "1000"))
+    # vector search backend: "memory" (resident corpus, client-side cosine) or "pgvector" (top-k in Postgres)
+    search_backend: str = os.getenv("SEARCH_BACKEND", "memory")
+    database_url: str = os.getenv("DATABASE_URL", "")
+    pg_pool_size: int = int(os.getenv("PG_POOL_SIZE", "4"))
+    # in-memory ranking: "exact" (brute-force cosine), "hnsw" (approximate, needs hnswlib),
+    # "int8" / "pq" / "pca" / "binary" (compressed first-pass scan, re-scored with full-precision vectors),
+    # "sharded" (exact scan split across SEARCH_SHARDS worker processes; 0 = one per core)
+    search_mode: str = os.getenv("SEARCH_MODE", "exact")
+    search_shards: int = int(os.getenv("SEARCH_SHARDS", "0"))
+    hnsw_m: int = int(os.getenv("HNSW_M", "16"))
+    hnsw_ef_construction: int = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+    hnsw_ef_search: int = int(os.getenv("HNSW_EF_SEARCH", "64"))
+    # rows per block in the streaming exact scan (bounds scan memory independently of corpus size)
+    scan_block_rows: int = int(os.getenv("SCAN_BLOCK_ROWS", "16384"))
+    pq_subspaces: int = int(os.getenv("PQ_SUBSPACES", "96"))
+    # components kept by SEARCH_MODE=pca (128 or 256 for 768-d CodeBERT vectors)
+    pca_dim: int = int(os.getenv("PCA_DIM", "128"))
+    rescore_candidates: int = int(os.getenv("RESCORE_CANDIDATES", "200"))
+    # SEARCH_MODE=binary ranks on sign bits only and needs a deeper re-scoring pass
+    binary_rescore_candidates: int = int(os.getenv("BINARY_RESCORE_CANDIDATES", "2000"))
     # local docs mode (unused in Supabase mode but kept for flexibility)
     docs_path: str = os.getenv("DOCS_PATH", "data/docs")
     embed_cache: str = os.getenv("EMBED_CACHE", "data/cache/embeddings.npy")
     meta_cache: str = os.getenv("META_CACHE", "data/cache/meta.jsonl")
+    # re-hash the cache files against the manifest checksums on load (slow for big corpora)
+    cache_verify: bool = os.getenv("CACHE_VERIFY", "0") == "1"
+    # several processes (e.g. uvicorn workers) serve one memory-mapped copy of the cache;
+    # a refresh in any of them is picked up by the others within SHARED_POLL seconds
+    shared_corpus: bool = os.getenv("SHARED_CORPUS", "0") == "1"
+    shared_poll: float = float(os.getenv("SHARED_POLL", "1"))
 
 settings = Settings()
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import numpy as np
+import torch
+from config import settings
+from retrieval import cache as corpus_cache
+from retrieval.embedder import CodeBERTEmbedder
+from retrieval.store import _max_watermark, _sync_column
+from retrieval.vectors import l2_normalize
+from vendors.supabase_client import get_client
+
+
+def _job_key(dry_run: bool = False) -> Dict[str, Any]:
+    # A checkpoint is only resumed for the same table, column and model settings, and never across
+    # --dry-run and a real run (a dry run's cursor is past rows that were never written back)
+    return {
+        "dry_run": dry_run,
+        "table": settings.table_name,
+        "id_column": settings.id_column,
+        "vector_column": settings.vector_column,
+        "model": settings.model_name,
+        "max_length": settings.max_length,
+        "backend": settings.embedding_backend,
+    }
+
+
+class Checkpoint:
+    """Progress of a re-embedding run plus the staged vectors/metadata for the local cache."""
+
+    def __init__(self, path: Path, dry_run: bool = False):
+        self.path = path
+        self.dry_run = dry_run
+        self.vectors_path = path.with_suffix(".vectors.f32")
+        self.meta_path = path.with_suffix(".meta.jsonl")
+        self.state: Dict[str, Any] = {
+            "key": _job_key(dry_run),
+            "cursor": None,
+            "rows": 0,
+            "staged": 0,
+            "meta_bytes": 0,
+            "dim": None,
+            "watermark": None,
+            "done": False,
+        }
+
+    def load(self) -> bool:
+        try:
+            state = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if state.get("key") != _job_key(self.dry_run):
+            print(f"Ignoring checkpoint {self.path}: written for other settings")
+            return False
+        self.state = state
+        # Drop anything staged after the last checkpoint
+        dim = state["dim"] or 0
+        for path, size in ((self.vectors_path, state["staged"] * dim * 4), (self.meta_path, state["meta_bytes"])):
+            with open(path, "ab") as f:
+                f.truncate(size)
+        return True
+
+    def reset(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        for path in (self.vectors_path, self.meta_path):
+            path.write_bytes(b"")
+        self.save()
+
+    def save(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.state, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def stage(self, vectors: np.ndarray, metas: List[dict]) -> None:
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self.meta_path, "ab") as f:
+            for m in metas:
+                f.write((json.dumps(m, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.state["meta_bytes"] = f.tell()
+        self.state["staged"] += len(metas)
+        self.state["dim"] = int(vectors.shape[1])
+
+
+def _fetch_page(client: Any, cursor: Any, page_size: int) -> List[dict]:
+    cols = [settings.id_column, settings.content_column]
+    for extra in (_sync_column(), settings.deleted_column):
+        if extra and extra not in cols:
+            cols.append(extra)
+    query = client.table(settings.table_name).select(",".join(cols))
+    if cursor is not None:
+        query = query.gt(settings.id_column, cursor)
+    return query.order(settings.id_column).limit(page_size).execute().data or []
+
+
+def _write_back(client: Any, rows: List[dict], vectors: np.ndarray, chunk: int) -> int:
+    # Only the vector column of rows that still exist is updated (set_embeddings in sql/reembed.sql), so a row
+    # deleted mid-job is not re-inserted and a concurrent content edit is not overwritten with the text read here
+    updated = 0
+    for start in range(0, len(rows), chunk):
+        resp = client.rpc(
+            "set_embeddings",
+            {
+                "table_name": settings.table_name,
+                "id_column": settings.id_column,
+                "vector_column": settings.vector_column,
+                "ids": [str(r.get(settings.id_column)) for r in rows[start:start + chunk]],
+                # pgvector text form; the function casts it to the column's type
+                "vectors": ["[" + ",".join(f"{x:.7g}" for x in v.tolist()) + "]" for v in vectors[start:start + chunk]],
+            },
+        ).execute()
+        updated += int(resp.data or 0)
+    if updated < len(rows):
+        print(f"{len(rows) - updated} rows were deleted before their vectors were written back")
+    return updated
+
+
+def _write_cache(ckpt: Checkpoint) -> None:
+    n, dim = ckpt.state["staged"], ckpt.state["dim"]
+    if not settings.embed_cache or not n:
+        return
+    matrix = np.memmap(ckpt.vectors_path, dtype=np.float32, mode="r", shape=(n, dim))
+    with open(ckpt.meta_path, "rb") as f:
+        meta = [json.loads(line) for line in f]
+    previous = corpus_cache.read_manifest()
+    version = (previous or {}).get("version", 0) + 1
+    with corpus_cache.CorpusLock():
+        manifest = corpus_cache.save_corpus(matrix, meta, version, ckpt.state["watermark"])
+    print(f"Wrote corpus cache version {manifest['version']} ({n} rows) to {settings.embed_cache}")
+
+
+def run(args: argparse.Namespace) -> None:
+    threads = args.threads or os.cpu_count() or 1
+    torch.set_num_threads(threads)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+    if not settings.onnx_threads:
+        settings.onnx_threads = threads
+
+    ckpt = Checkpoint(Path(args.checkpoint), dry_run=args.dry_run)
+    if args.restart or not ckpt.load():
+        ckpt.reset()
+    elif ckpt.state["done"]:
+        print(f"Checkpoint {ckpt.path} is complete; pass --restart to run again")
+        return
+    else:
+        print(f"Resuming after {settings.id_column}={ckpt.state['cursor']!r} ({ckpt.state['rows']} rows done)")
+
+    client = get_client()
+    embedder = CodeBERTEmbedder()
+    started = time.perf_counter()
+    done_at_start = ckpt.state["rows"]
+
+    def commit(page: Dict[str, Any]) -> None:
+        # only called once the page has been written back, so the checkpoint never gets ahead of the table
+        live = page["live"]
+        if live:
+            ckpt.stage(
+                l2_normalize(page["vectors"]).astype(np.float32, copy=False),
+                [{"id": r.get(settings.id_column), "content": r.get(settings.content_column, "")} for r in live],
+            )
+        ckpt.state["cursor"] = page["rows"][-1].get(settings.id_column)
+        ckpt.state["rows"] += len(page["rows"])
+        ckpt.state["watermark"] = page["watermark"]
+        ckpt.save()
+        elapsed = time.perf_counter() - started
+        rate = (ckpt.state["rows"] - done_at_start) / elapsed if elapsed > 0 else 0.0
+        print(f"{ckpt.state['rows']} rows re-embedded ({rate:.1f} rows/s)")
+
+    # Page N+1 is read and page N-1 is written back while page N is embedded
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="reembed-io") as io:
+        next_page: Future = io.submit(_fetch_page, client, ckpt.state["cursor"], args.page_size)
+        prev: Optional[Dict[str, Any]] = None
+        pending: Optional[Future] = None
+        while True:
+            rows = next_page.result()
+            page = None
+            if rows:
+                next_page = io.submit(_fetch_page, client, rows[-1].get(settings.id_column), args.page_size)
+                watermark = ckpt.state["watermark"] if prev is None else prev["watermark"]
+                for r in rows:
+                    watermark = _max_watermark(watermark, r.get(_sync_column()))
+                live = [r for r in rows if not (settings.deleted_column and r.get(settings.deleted_column))]
+                texts = [r.get(settings.content_column) or "" for r in live]
+                vectors = embedder.embed_corpus(texts, batch_tokens=args.batch_tokens)
+                page = {"rows": rows, "live": live, "vectors": vectors, "watermark": watermark}
+            if prev is not None:
+                if pending is not None:
+                    pending.result()
+                commit(prev)
+            if page is None:
+                break
+            pending = None if args.dry_run else io.submit(_write_back, client, page["live"], page["vectors"], args.upsert_chunk)
+            prev = page
+    if args.dry_run:
+        # the shared corpus cache must keep matching the table, which a dry run did not change
+        print(f"Dry run: {ckpt.state['staged']} vectors staged in {ckpt.vectors_path}; corpus cache left as is")
+    else:
+        _write_cache(ckpt)
+    ckpt.state["done"] = True
+    ckpt.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the embedding column with the configured CodeBERT model (resumable)")
+    parser.add_argument("--page-size", type=int, default=settings.load_page_size, help="Rows read per request")
+    parser.add_argument("--batch-tokens", type=int, default=settings.embed_batch_tokens, help="Padded tokens per forward pass")
+    parser.add_argument("--upsert-chunk", type=int, default=500, help="Rows per set_embeddings call")
+    parser.add_argument("--checkpoint", default=str(Path(settings.embed_cache or "data/cache/embeddings.npy").with_name("reembed.json")))
+    parser.add_argument("--threads", type=int, default=0, help="Torch/ONNX threads (default: all cores)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Embed and stage vectors without writing to the table or the corpus cache")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,33 @@
 from __future__ import annotations
-from typing import List, Optional
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
+import atexit
+import hashlib
+import os
+import threading
+import numpy as np
 from sentence_transformers import CrossEncoder
+from config import settings
+from retrieval.embedder import length_buckets, normalize_query
 from retrieval.search import SearchResult
 from rerank.feedback import FeedbackStore
 
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# 16-byte query digest + 16-byte content digest
+_DIGEST_BYTES = 16
+# resident cost of one entry (bytes key + float + OrderedDict node), measured with tracemalloc on CPython 3.11
+_ENTRY_BYTES = 200
+# recent per-request depths kept for the percentiles in CascadeStats.stats()
+_DEPTH_SAMPLES = 2048
+# pairs per model call with RERANK_BATCH_TOKENS=0, as CrossEncoder.predict's default batch_size
+_PREDICT_BATCH = 32
+# documents are cut to this many characters per window token before tokenizing, so a huge file costs no more to
+# pre-truncate than one that just fits; code tokens, indentation runs included, are far shorter than this
+_MAX_TOKEN_CHARS = 32
+
 
 @dataclass
 class RerankedResult:
@@ -13,15 +36,326 @@ class RerankedResult:
     cross_encoder_score: float | None = None
 
 
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=_DIGEST_BYTES).digest()
+
+
+class CrossEncoderScoreCache:
+    """Bounded LRU of (query hash, content hash) -> cross-encoder logit.
+
+    With a `path`, the entries are loaded from it on start and written back
+    (most recently used last) by `save()` and at interpreter exit, so a
+    restart begins with the previous hot set. A file written for another
+    model is ignored.
+    """
+
+    def __init__(self, model_name: str, max_entries: Optional[int] = None, path: Optional[str] = None):
+        self.model_name = model_name
+        self.max_entries = settings.ce_cache_size if max_entries is None else max_entries
+        self.path = Path(path) if path else None
+        self._entries: "OrderedDict[bytes, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.path is not None and self.max_entries > 0:
+            self.load()
+            atexit.register(self.save)
+
+    @contextmanager
+    def bypassed(self) -> Iterator[None]:
+        """Inside the block the calling thread neither reads nor writes the cache (warm-up traffic)."""
+        self._local.bypass = True
+        try:
+            yield
+        finally:
+            self._local.bypass = False
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[float]]:
+        if getattr(self._local, "bypass", False):
+            return [None] * len(keys)
+        with self._lock:
+            out: List[Optional[float]] = []
+            for key in keys:
+                value = self._entries.get(key)
+                if value is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                out.append(value)
+            return out
+
+    def put_many(self, keys: List[bytes], values: List[float]) -> None:
+        if self.max_entries <= 0 or getattr(self._local, "bypass", False):
+            return
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._entries[key] = float(value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": len(self._entries) * _ENTRY_BYTES,
+                "path": str(self.path) if self.path is not None else None,
+            }
+
+    def load(self) -> int:
+        try:
+            with np.load(self.path) as data:
+                if str(data["model"]) != self.model_name:
+                    return 0
+                keys, scores = data["keys"], data["scores"]
+        except (OSError, ValueError, KeyError):
+            return 0
+        # the file is in LRU order; keep the most recent entries that fit
+        start = max(0, keys.shape[0] - self.max_entries)
+        with self._lock:
+            for key, value in zip(keys[start:], scores[start:].tolist()):
+                self._entries[key.tobytes()] = value
+        print(f"Loaded {keys.shape[0] - start} cached cross-encoder scores from {self.path}")
+        return keys.shape[0] - start
+
+    def save(self) -> bool:
+        if self.path is None:
+            return False
+        with self._lock:
+            if not self._dirty:
+                return False
+            keys = np.frombuffer(b"".join(self._entries), dtype=np.uint8).reshape(-1, 2 * _DIGEST_BYTES)
+            scores = np.fromiter(self._entries.values(), dtype=np.float32, count=len(self._entries))
+            self._dirty = False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.savez(f, keys=keys, scores=scores, model=np.array(self.model_name))
+            os.replace(tmp, self.path)
+            return True
+        except OSError as exc:
+            print(f"Could not write cross-encoder score cache: {exc}")
+            return False
+
+
+class CascadeStats:
+    """How many candidates cascade reranking actually cross-encoded, per request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._depths: deque = deque(maxlen=_DEPTH_SAMPLES)
+        self.requests = 0
+        self.candidates = 0
+        self.pairs = 0
+        # stopped because the deepest window fell below the k-th best score
+        self.stopped_early = 0
+        # wanted to go deeper but hit the per-request cap
+        self.capped = 0
+
+    def record(self, depth: int, candidates: int, stopped_early: bool, capped: bool) -> None:
+        with self._lock:
+            self._depths.append(depth)
+            self.requests += 1
+            self.candidates += candidates
+            self.pairs += depth
+            self.stopped_early += int(stopped_early)
+            self.capped += int(capped)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            depths = np.fromiter(self._depths, dtype=np.float64)
+            return {
+                "requests": self.requests,
+                "candidates": self.candidates,
+                "pairs_scored": self.pairs,
+                "skipped_fraction": round(1.0 - self.pairs / self.candidates, 3) if self.candidates else 0.0,
+                "stopped_early": self.stopped_early,
+                "capped": self.capped,
+                "depth": {
+                    "mean": round(float(depths.mean()), 2) if depths.size else 0.0,
+                    "p50": float(np.percentile(depths, 50)) if depths.size else 0.0,
+                    "p95": float(np.percentile(depths, 95)) if depths.size else 0.0,
+                    "max": int(depths.max()) if depths.size else 0,
+                },
+            }
+
+
+def _activation(config: Any):
+    # CrossEncoder.predict applies the activation named in the model config (Sigmoid by default for one label);
+    # the ONNX graph returns raw logits, so apply the same one to keep both backends' scores identical
+    path = (getattr(config, "sentence_transformers", None) or {}).get("activation_fn")
+    path = path or getattr(config, "sbert_ce_default_activation_function", None)
+    if path is None:
+        path = "torch.nn.modules.activation.Sigmoid" if config.num_labels == 1 else "torch.nn.modules.linear.Identity"
+    if path.endswith("Sigmoid"):
+        return lambda x: 1.0 / (1.0 + np.exp(-x))
+    if path.endswith("Identity"):
+        return lambda x: x
+    raise ValueError(f"Unsupported cross-encoder activation for the ONNX backends: {path}")
+
+
 class CrossEncoderScorer:
-    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
-        self.model = CrossEncoder(model_name)
+    """Cross-encoder relevance scores for (query, text) pairs.
 
-    def score(self, query: str, texts: List[str]) -> List[float]:
-        pairs = [(query, t) for t in texts]
-        scores = self.model.predict(pairs, convert_to_numpy=True)
+    `backend` ("torch", "onnx" or "onnx-int8"; CROSS_ENCODER_BACKEND by
+    default) selects sentence-transformers' CrossEncoder or an ONNX Runtime
+    graph of the same model, exported (and quantized) on first use.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER, cache: Optional[CrossEncoderScoreCache] = None, backend: Optional[str] = None):
+        self.model_name = model_name
+        self.backend = backend or settings.cross_encoder_backend
+        self.model = None
+        self.encoder = None
+        if self.backend == "torch":
+            self.model = CrossEncoder(model_name)
+            self.tokenizer = self.model.tokenizer
+            self.max_length = getattr(self.model, "max_seq_length", None) or self.tokenizer.model_max_length
+        else:
+            # onnxruntime is only needed for the ONNX backends
+            from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+            from retrieval.onnx_backend import ONNX_BACKENDS, OnnxEncoder, ensure_model
+            if self.backend not in ONNX_BACKENDS:
+                raise ValueError(f"Unknown cross-encoder backend: {self.backend!r} (expected 'torch', 'onnx' or 'onnx-int8')")
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+            config = AutoConfig.from_pretrained(model_name)
+            # as CrossEncoder: the tokenizer limit, capped at the model's position embeddings
+            self.max_length = min(self.tokenizer.model_max_length, getattr(config, "max_position_embeddings", self.tokenizer.model_max_length))
+            self.activation = _activation(config)
+            path = ensure_model(
+                model_name,
+                self.backend,
+                lambda: AutoModelForSequenceClassification.from_pretrained(model_name),
+                output="logits",
+                token_type_ids="token_type_ids" in self.tokenizer.model_input_names,
+            )
+            self.encoder = OnnxEncoder(path)
+        # scores differ slightly between backends, so each keeps its own cache file contents
+        cache_key = model_name if self.backend == "torch" else f"{model_name}@{self.backend}"
+        self.cache = cache or CrossEncoderScoreCache(cache_key, path=settings.ce_cache_path or None)
+        self.cascade_stats = CascadeStats()
+
+    def predict(self, pairs: List[Tuple[str, str]], batch_tokens: Optional[int] = None) -> List[float]:
+        """Scores for `pairs` straight from the model, bypassing the cache, in the order given.
+
+        Each text is first cut to what fits in the model window next to its
+        query. The pairs are then sorted by token length and grouped into
+        batches of at most `batch_tokens` padded tokens (RERANK_BATCH_TOKENS
+        by default), so short candidates are not padded to the longest one.
+        With `batch_tokens=0` the pairs go to the model as they are,
+        `_PREDICT_BATCH` at a time in input order.
+        """
+        if not pairs:
+            return []
+        budget = settings.rerank_batch_tokens if batch_tokens is None else batch_tokens
+        if budget > 0:
+            pairs, lengths = self._truncate(pairs)
+            batches = length_buckets(lengths, budget)
+        else:
+            batches = [np.arange(start, min(len(pairs), start + _PREDICT_BATCH)) for start in range(0, len(pairs), _PREDICT_BATCH)]
+        scores = np.empty(len(pairs), dtype=np.float64)
+        for rows in batches:
+            scores[rows] = self._predict_batch([pairs[i] for i in rows])
         return scores.tolist()
 
+    def _truncate(self, pairs: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+        # Cut each text at the last token that fits in max_length next to its query and the special tokens;
+        # the model would drop the rest anyway. Returns the cut pairs and each pair's length in tokens.
+        specials = self.tokenizer.num_special_tokens_to_add(pair=True)
+        query_lengths = {q: len(self.tokenizer(q, add_special_tokens=False)["input_ids"]) for q in {q for q, _ in pairs}}
+        rooms = [max(1, self.max_length - specials - query_lengths[q]) for q, _ in pairs]
+        clipped = [t[:room * _MAX_TOKEN_CHARS] for (_, t), room in zip(pairs, rooms)]
+        enc = self.tokenizer(clipped, add_special_tokens=False, truncation=True, max_length=max(rooms), return_offsets_mapping=True)
+        out = []
+        lengths = np.empty(len(pairs), dtype=np.int64)
+        for i, ((q, _), text, room) in enumerate(zip(pairs, clipped, rooms)):
+            offsets = enc["offset_mapping"][i]
+            kept = min(len(offsets), room)
+            if kept == room:
+                text = text[:offsets[kept - 1][1]]
+            out.append((q, text))
+            lengths[i] = min(self.max_length, specials + query_lengths[q] + kept)
+        return out, lengths
+
+    def _predict_batch(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        if self.model is not None:
+            return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False, convert_to_numpy=True)
+        batch = self.tokenizer(
+            [q for q, _ in pairs],
+            [t for _, t in pairs],
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        logits = self.encoder(batch["input_ids"], batch["attention_mask"], batch.get("token_type_ids"))
+        return self.activation(logits[:, 0].astype(np.float64))
+
+    def score_cascade(self, query: str, texts: List[str], k: int, max_depth: Optional[int] = None) -> Tuple[List[Optional[float]], int]:
+        """Cross-encode `texts` (best first-stage similarity first) only as deep as the scores suggest.
+
+        The top max(RERANK_INITIAL_DEPTH, 2k) are scored first. Scoring goes
+        RERANK_STEP deeper while the deepest RERANK_STEP scored candidates
+        still come within RERANK_MARGIN logits of the k-th best score so far.
+        It never goes past `max_depth` (default RERANK_MAX_DEPTH, 0 = all).
+        Returns (scores, depth); candidates past `depth` have no score.
+        """
+        n = len(texts)
+        if max_depth is None:
+            cap = min(n, settings.rerank_max_depth) if settings.rerank_max_depth > 0 else n
+        else:
+            cap = min(n, max(max_depth, 0))
+        depth = min(cap, max(settings.rerank_initial_depth, 2 * k)) if settings.rerank_cascade else cap
+        scores = self.score(query, texts[:depth]) if depth else []
+        step = max(1, settings.rerank_step)
+        stopped_early = False
+        while settings.rerank_cascade and 0 < depth < n:
+            kth = sorted(scores, reverse=True)[min(k, depth) - 1]
+            if max(scores[-step:]) < kth - settings.rerank_margin:
+                stopped_early = True
+                break
+            if depth >= cap:
+                break
+            deeper = min(cap, depth + step)
+            scores += self.score(query, texts[depth:deeper])
+            depth = deeper
+        capped = settings.rerank_cascade and not stopped_early and depth == cap < n
+        self.cascade_stats.record(depth, n, stopped_early, capped)
+        return scores + [None] * (n - depth), depth
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """Cross-encoder logits for (query, text) pairs; only pairs not already in the score cache reach the model."""
+        # Keyed like the query embedding cache; the cross-encoder still scores the caller's (case-sensitive) text
+        qhash = _digest(normalize_query(query) if self.cache.max_entries > 0 else query)
+        keys = [qhash + _digest(t) for t in texts]
+        scores = self.cache.get_many(keys)
+        missing: Dict[bytes, str] = {}
+        for key, text, value in zip(keys, texts, scores):
+            if value is None and key not in missing:
+                missing[key] = text
+        if missing:
+            fresh = self.predict([(query, t) for t in missing.values()])
+            self.cache.put_many(list(missing), fresh)
+            computed = dict(zip(missing, fresh))
+            scores = [computed[key] if value is None else value for key, value in zip(keys, scores)]
+        return scores
+
 
 def _min_max_scale(values: List[float]) -> List[float]:
     if not values:
@@ -33,20 +367,33 @@ def _min_max_scale(values: List[float]) -> List[float]:
     return [(v - vmin) / (vmax - vmin) for v in values]
 
 
+def _blend(base: float, ce: Optional[float], cross_encoded: bool) -> float:
+    if not cross_encoded:
+        return base
+    # A candidate the cascade did not reach ranks as if it got the lowest cross-encoder score
+    return 0.5 * base + 0.5 * (ce if ce is not None else 0.0)
+
+
 def rerank_with_feedback(
     results: List[SearchResult],
     user_id: Optional[str],
     feedback: FeedbackStore,
     query_text: Optional[str] = None,
     cross_encoder: Optional[CrossEncoderScorer] = None,
+    raw_cross_scores: Optional[List[Optional[float]]] = None,
 ) -> List[RerankedResult]:
+    """`raw_cross_scores` are precomputed logits aligned with `results` (None = not cross-encoded, e.g. past the cascade depth)."""
     if not results:
         return []
 
-    cross_scores: List[float] | None = None
-    if cross_encoder is not None and query_text is not None:
-        raw = cross_encoder.score(query_text, [r.content for r in results])
-        cross_scores = _min_max_scale(raw)
+    if raw_cross_scores is None and cross_encoder is not None and query_text is not None:
+        raw_cross_scores = cross_encoder.score(query_text, [r.content for r in results])
+    cross_scores: List[Optional[float]] | None = None
+    if raw_cross_scores is not None:
+        scored = [i for i, v in enumerate(raw_cross_scores) if v is not None]
+        cross_scores = [None] * len(results)
+        for i, v in zip(scored, _min_max_scale([raw_cross_scores[i] for i in scored])):
+            cross_scores[i] = v
 
     # If no user_id provided, apply only cross-encoder if present
     if not user_id:
@@ -54,7 +401,7 @@ def rerank_with_feedback(
         for idx, r in enumerate(results):
             ce = cross_scores[idx] if cross_scores is not None else None
             base = r.similarity  # already ~[0,1]
-            blended = base if ce is None else 0.5 * base + 0.5 * ce
+            blended = _blend(base, ce, cross_scores is not None)
             reranked.append(RerankedResult(r, blended, cross_encoder_score=ce))
         reranked.sort(key=lambda x: x.rerank_score, reverse=True)
         return reranked
@@ -66,7 +413,7 @@ def rerank_with_feedback(
     for idx, r in enumerate(results):
         ce = cross_scores[idx] if cross_scores is not None else None
         base = r.similarity
-        blended = base if ce is None else (0.5 * base + 0.5 * ce)
+        blended = _blend(base, ce, cross_scores is not None)
         user_score = feedback.get_score(user_id, str(r.id), r.content)
 
         if user_score > 0:
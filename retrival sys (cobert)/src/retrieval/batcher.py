@@ -0,0 +1,118 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import queue
+import threading
+import time
+import numpy as np
+from config import settings
+
+# recent queueing delays kept for the percentiles in stats()
+_DELAY_SAMPLES = 2048
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent embedding requests into one padded forward pass.
+
+    The first text to arrive opens a window of `window_ms`. Everything that
+    arrives before it closes, up to `max_batch` texts, is embedded with a
+    single `embed_fn` call. Each caller then gets its own rows back. Only
+    these queued single-query misses are serialised on the batcher's thread:
+    multi-query embeds and embed_corpus call the model directly and can run
+    alongside it.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], np.ndarray],
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+    ):
+        self.embed_fn = embed_fn
+        self.window = (settings.embed_batch_window_ms if window_ms is None else window_ms) / 1000.0
+        self.max_batch = max(1, max_batch or settings.embed_max_batch)
+        self._queue: "queue.Queue[Tuple[str, float, Future] | None]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes: Dict[int, int] = {}
+        self._delays: deque = deque(maxlen=_DELAY_SAMPLES)
+        self.batches = 0
+        self.texts = 0
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._queue.put((text, time.perf_counter(), fut))
+        return fut
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        futures = [self.submit(t) for t in texts]
+        return np.stack([f.result() for f in futures]) if futures else np.zeros((0, 0), dtype=np.float32)
+
+    async def embed_async(self, texts: List[str]) -> np.ndarray:
+        futures = [asyncio.wrap_future(self.submit(t)) for t in texts]
+        rows = await asyncio.gather(*futures)
+        return np.stack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+    def _collect(self) -> List[Tuple[str, float, Future]] | None:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                self.texts += len(batch)
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._delays.extend((started - enqueued) * 1000.0 for _, enqueued, _ in batch)
+            try:
+                vectors = np.asarray(self.embed_fn([text for text, _, _ in batch]), dtype=np.float32)
+            except Exception as exc:
+                for _, _, fut in batch:
+                    fut.set_exception(exc)
+                continue
+            for row, (_, _, fut) in zip(vectors, batch):
+                fut.set_result(row)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            delays = np.fromiter(self._delays, dtype=np.float64)
+            sizes = dict(sorted(self._batch_sizes.items()))
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "batch_sizes": sizes,
+            "queue_delay_ms": {
+                "p50": round(float(np.percentile(delays, 50)), 3) if delays.size else 0.0,
+                "p95": round(float(np.percentile(delays, 95)), 3) if delays.size else 0.0,
+                "max": round(float(delays.max()), 3) if delays.size else 0.0,
+            },
+        }
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout)
@@ -0,0 +1,221 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock only covers threads of this process
+    fcntl = None
+
+
+CACHE_FORMAT = 1
+
+
+def _offsets_path(meta_path: Path) -> Path:
+    return meta_path.with_suffix(".offsets.npy")
+
+
+def _manifest_path(embed_path: Path) -> Path:
+    return embed_path.with_suffix(".manifest.json")
+
+
+def _lock_path(embed_path: Path) -> Path:
+    return embed_path.with_suffix(".lock")
+
+
+def _corpus_key() -> Dict[str, Any]:
+    # A cache written for another table/column/model must never be served
+    return {
+        "table": settings.table_name,
+        "id_column": settings.id_column,
+        "vector_column": settings.vector_column,
+        "content_column": settings.content_column,
+        "model": settings.model_name,
+    }
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class MetaReader:
+    """Read-only view of meta.jsonl; rows are decoded on access via the offset index."""
+
+    def __init__(self, path: Path, offsets: np.ndarray):
+        self.path = path
+        self.offsets = offsets
+        self._fh = open(path, "rb")
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0]) - 1
+
+    def __getitem__(self, i: int) -> dict:
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(i)
+        start = int(self.offsets[i])
+        size = int(self.offsets[i + 1]) - start
+        with self._lock:
+            self._fh.seek(start)
+            line = self._fh.read(size)
+        return json.loads(line)
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class CorpusLock:
+    """Cross-process exclusive lock on the cache files (flock on embeddings.lock).
+
+    Re-entrant within a thread, so a writer holding it can call helpers that
+    take it again. Processes sharing one cache serialize publish and attach
+    on it, so nobody maps a half-replaced set of files.
+    """
+
+    def __init__(self, embed_path: Optional[str] = None):
+        self.path = _lock_path(Path(embed_path or settings.embed_cache))
+        self._local = threading.RLock()
+        self._depth = 0
+        self._fh: Any = None
+
+    def __enter__(self) -> "CorpusLock":
+        self._local.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._fh = open(self.path, "a+b")
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                if self._fh is not None:
+                    self._fh.close()
+                    self._fh = None
+                self._local.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fh is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+            self._fh.close()
+            self._fh = None
+        self._local.release()
+
+
+def manifest_stamp(embed_path: Optional[str] = None) -> Optional[Tuple[int, int]]:
+    """(inode, mtime) of the manifest; changes whenever a new cache generation is published."""
+    try:
+        st = _manifest_path(Path(embed_path or settings.embed_cache)).stat()
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def save_corpus(
+    matrix: np.ndarray,
+    meta: Sequence[dict],
+    version: int,
+    watermark: Any = None,
+    embed_path: Optional[str] = None,
+    meta_path: Optional[str] = None,
+) -> Dict[str, Any]:
+    embed = Path(embed_path or settings.embed_cache)
+    meta_file = Path(meta_path or settings.meta_cache)
+    embed.parent.mkdir(parents=True, exist_ok=True)
+    meta_file.parent.mkdir(parents=True, exist_ok=True)
+    offsets_file = _offsets_path(meta_file)
+    manifest_file = _manifest_path(embed)
+
+    # Write everything to temp files, then swap in; the manifest goes last so
+    # a reader never sees a manifest that points at half-written data.
+    tmp_embed = embed.with_name(embed.name + ".tmp")
+    n, dim = int(matrix.shape[0]), int(matrix.shape[1])
+    with open(tmp_embed, "wb") as f:
+        # written block by block, so a memory-mapped or segmented matrix is never copied whole into RAM
+        np.lib.format.write_array_header_1_0(f, {"descr": "<f4", "fortran_order": False, "shape": (n, dim)})
+        for start in range(0, n, settings.scan_block_rows):
+            f.write(np.ascontiguousarray(matrix[start:start + settings.scan_block_rows], dtype="<f4").tobytes())
+    offsets = np.zeros(len(meta) + 1, dtype=np.int64)
+    tmp_meta = meta_file.with_name(meta_file.name + ".tmp")
+    with open(tmp_meta, "wb") as f:
+        pos = 0
+        for i, m in enumerate(meta):
+            line = (json.dumps({"id": m["id"], "content": m["content"]}, ensure_ascii=False) + "\n").encode("utf-8")
+            f.write(line)
+            pos += len(line)
+            offsets[i + 1] = pos
+    tmp_offsets = offsets_file.with_name(offsets_file.name + ".tmp")
+    with open(tmp_offsets, "wb") as f:
+        np.save(f, offsets)
+
+    manifest = {
+        "format": CACHE_FORMAT,
+        "corpus": _corpus_key(),
+        "version": version,
+        "watermark": watermark,
+        "rows": len(meta),
+        "dim": int(matrix.shape[1]),
+        "embeddings_sha256": _sha256_file(tmp_embed),
+        "meta_sha256": _sha256_file(tmp_meta),
+    }
+    os.replace(tmp_embed, embed)
+    os.replace(tmp_meta, meta_file)
+    os.replace(tmp_offsets, offsets_file)
+    tmp_manifest = manifest_file.with_name(manifest_file.name + ".tmp")
+    tmp_manifest.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp_manifest, manifest_file)
+    return manifest
+
+
+def read_manifest(embed_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    path = _manifest_path(Path(embed_path or settings.embed_cache))
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def load_corpus(
+    embed_path: Optional[str] = None, meta_path: Optional[str] = None, verify: Optional[bool] = None
+) -> Optional[Tuple[np.ndarray, MetaReader, Dict[str, Any]]]:
+    """Memory-map a cached corpus; returns None when the cache is missing, foreign or inconsistent."""
+    embed = Path(embed_path or settings.embed_cache)
+    meta = Path(meta_path or settings.meta_cache)
+    verify = settings.cache_verify if verify is None else verify
+    manifest = read_manifest(str(embed))
+    if manifest is None or manifest.get("format") != CACHE_FORMAT or manifest.get("corpus") != _corpus_key():
+        return None
+    try:
+        mat = np.load(embed, mmap_mode="r")
+        offsets = np.load(_offsets_path(meta))
+        meta_size = meta.stat().st_size
+    except (OSError, ValueError):
+        return None
+    rows = manifest["rows"]
+    if mat.dtype != np.float32 or mat.shape != (rows, manifest["dim"]):
+        return None
+    if offsets.shape[0] != rows + 1 or int(offsets[-1]) != meta_size:
+        return None
+    if verify and (
+        _sha256_file(embed) != manifest["embeddings_sha256"] or _sha256_file(meta) != manifest["meta_sha256"]
+    ):
+        return None
+    return mat, MetaReader(meta, offsets), manifest
@@ -1,10 +1,106 @@
-from typing import List
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import os
+import threading
+import time
+import numpy as np
 import torch
-from transformers import AutoTokenizer, AutoModel
+from transformers import AutoConfig, AutoTokenizer, AutoModel
 from config import settings
+from retrieval.batcher import EmbeddingBatcher
+
+
+def length_buckets(lengths: np.ndarray, budget: int) -> List[np.ndarray]:
+    """Group item positions, sorted by ascending length, into batches of at most `budget` padded tokens.
+
+    A batch pads to its longest member, so each holds as many items as fit
+    `budget // length` of that member; a single item longer than the budget
+    still gets a batch of its own. Shared by embed_corpus and the cross-encoder.
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches = []
+    pos = 0
+    while pos < len(order):
+        # ascending lengths: the newest member is the longest, so it sets the padded width
+        end = pos + 1
+        while end < len(order) and (end - pos + 1) * lengths[order[end]] <= budget:
+            end += 1
+        batches.append(order[pos:end])
+        pos = end
+    return batches
+
+
+def normalize_query(text: str) -> str:
+    text = " ".join(text.split())
+    return text.casefold() if settings.query_cache_casefold else text
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU of query text -> float32 embedding, with an optional TTL."""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = settings.query_cache_size if max_entries is None else max_entries
+        self.ttl = settings.query_cache_ttl if ttl is None else ttl
+        self._entries: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "bytes": sum(v.nbytes for _, v in self._entries.values()),
+            }
+
 
 class CodeBERTEmbedder:
-    def __init__(self, model_name: str | None = None, device: str | None = None, max_length: int | None = None, hf_token: str | None = None):
+    def __init__(
+        self,
+        model_name: str | None = None,
+        device: str | None = None,
+        max_length: int | None = None,
+        hf_token: str | None = None,
+        backend: str | None = None,
+    ):
         self.model_name = model_name or settings.model_name
         requested_device = device or settings.device
         if requested_device.startswith("cuda") and not torch.cuda.is_available():
@@ -12,23 +108,146 @@ class CodeBERTEmbedder:
         else:
             self.device = requested_device
         self.max_length = max_length or settings.max_length
+        self.backend = backend or settings.embedding_backend
         auth_token = hf_token or settings.hf_token or None
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, use_fast=True, token=auth_token)
-        self.model = AutoModel.from_pretrained(self.model_name, token=auth_token)
-        self.model.to(self.device)
-        self.model.eval()
+        self.model = None
+        self.encoder = None
+        if self.backend == "torch":
+            self.model = AutoModel.from_pretrained(self.model_name, token=auth_token)
+            self.model.to(self.device)
+            self.model.eval()
+            self.hidden_size = self.model.config.hidden_size
+        else:
+            # onnxruntime is only needed for the ONNX backends
+            from retrieval.onnx_backend import ONNX_BACKENDS, OnnxEncoder, ensure_model
+            if self.backend not in ONNX_BACKENDS:
+                raise ValueError(f"Unknown embedding backend: {self.backend!r} (expected 'torch', 'onnx' or 'onnx-int8')")
+            path = ensure_model(
+                self.model_name, self.backend, lambda: AutoModel.from_pretrained(self.model_name, token=auth_token)
+            )
+            self.encoder = OnnxEncoder(path)
+            self.device = "cpu"
+            self.hidden_size = AutoConfig.from_pretrained(self.model_name, token=auth_token).hidden_size
+        self.query_cache = QueryEmbeddingCache()
+        # concurrent query misses share one forward pass (EMBED_BATCH_WINDOW_MS=0 turns this off)
+        self.batcher = None
+        if settings.embed_batch_window_ms > 0:
+            self.batcher = EmbeddingBatcher(lambda batch: self.embed(batch).numpy())
+
+    def embed_queries(self, texts: List[str]) -> torch.Tensor:
+        """`embed` for search queries: de-duplicated and served from the query cache when possible.
+
+        The cache is keyed on the normalized text, but CodeBERT (case-sensitive)
+        always embeds the caller's text: the first one seen for each missing key.
+        With the cache disabled nothing is normalized.
+        """
+        keys = [normalize_query(t) for t in texts] if self.query_cache.max_entries > 0 else list(texts)
+        found: Dict[str, np.ndarray] = {}
+        # normalized key -> original text that gets embedded for it
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            vec = self.query_cache.get(key)
+            if vec is None:
+                missing[key] = text
+            else:
+                found[key] = vec
+        if missing:
+            # a lone miss is coalesced with concurrent requests; a batch is already one forward pass
+            if self.batcher is not None and len(missing) == 1:
+                fresh = self.batcher.embed(list(missing.values()))
+            else:
+                fresh = self.embed(list(missing.values())).numpy().astype(np.float32, copy=False)
+            for key, vec in zip(missing, fresh):
+                self.query_cache.put(key, vec)
+                found[key] = vec
+        if not keys:
+            return torch.empty(0, self.hidden_size)
+        return torch.from_numpy(np.stack([found[key] for key in keys]))
 
     @torch.no_grad()
     def embed(self, texts: List[str]) -> torch.Tensor:
         if len(texts) == 0:
-            return torch.empty(0, self.model.config.hidden_size)
+            return torch.empty(0, self.hidden_size)
         batch = self.tokenizer(
             texts,
             padding=True,
             truncation=True,
             max_length=self.max_length,
-            return_tensors="pt",
+            return_tensors="np" if self.encoder is not None else "pt",
         )
+        return self._pooled(batch)
+
+    def embed_corpus(
+        self,
+        texts: Sequence[str],
+        batch_tokens: Optional[int] = None,
+        out_path: Optional[str] = None,
+        chunk_docs: int = 65536,
+    ) -> np.ndarray:
+        """Embed many documents in length-sorted batches of at most `batch_tokens` padded tokens.
+
+        Documents are tokenized and sorted by length `chunk_docs` at a time, so
+        each batch pads to nearly its own length. Rows come back in input order.
+        With `out_path`, rows are written into that .npy file as they are
+        computed, and a read-only memmap of it is returned.
+        """
+        n = len(texts)
+        budget = batch_tokens or settings.embed_batch_tokens
+        tmp_path = None
+        if out_path:
+            tmp_path = Path(out_path).with_name(Path(out_path).name + ".tmp")
+            tmp_path.parent.mkdir(parents=True, exist_ok=True)
+            out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(n, self.hidden_size))
+        else:
+            out = np.empty((n, self.hidden_size), dtype=np.float32)
+        tokens = padded = done = 0
+        started = last_log = time.perf_counter()
+        for chunk_start in range(0, n, chunk_docs):
+            chunk = [texts[i] for i in range(chunk_start, min(n, chunk_start + chunk_docs))]
+            ids = self.tokenizer(chunk, truncation=True, max_length=self.max_length)["input_ids"]
+            lengths = np.fromiter((len(x) for x in ids), dtype=np.int64, count=len(ids))
+            for rows in length_buckets(lengths, budget):
+                batch = self.tokenizer.pad(
+                    {"input_ids": [ids[i] for i in rows]},
+                    return_tensors="np" if self.encoder is not None else "pt",
+                )
+                out[chunk_start + rows] = self._pooled(batch).numpy()
+                tokens += int(lengths[rows].sum())
+                padded += len(rows) * int(lengths[rows[-1]])
+                done += len(rows)
+                now = time.perf_counter()
+                if now - last_log >= 10.0:
+                    last_log = now
+                    print(f"Embedded {done}/{n} docs ({done / (now - started):.1f} docs/s)")
+        elapsed = time.perf_counter() - started
+        self.corpus_stats = {
+            "docs": n,
+            "seconds": round(elapsed, 3),
+            "docs_per_s": round(n / elapsed, 1) if elapsed > 0 else 0.0,
+            "tokens": tokens,
+            # share of the computed token positions that were real tokens rather than padding
+            "padding_efficiency": round(tokens / padded, 3) if padded else 1.0,
+        }
+        print(f"Embedded {n} docs in {elapsed:.1f} s ({self.corpus_stats['docs_per_s']} docs/s)")
+        if tmp_path is not None:
+            out.flush()
+            del out
+            os.replace(tmp_path, out_path)
+            return np.load(out_path, mmap_mode="r")
+        return out
+
+    @torch.no_grad()
+    def _pooled(self, batch: Any) -> torch.Tensor:
+        # mean over real tokens of last_hidden_state, for an already padded batch
+        if self.encoder is not None:
+            token_embeddings = self.encoder(batch["input_ids"], batch["attention_mask"])
+            attention_mask = batch["attention_mask"][..., None].astype(np.float32)
+            summed = (token_embeddings * attention_mask).sum(axis=1)
+            counts = np.clip(attention_mask.sum(axis=1), 1, None)
+            return torch.from_numpy((summed / counts).astype(np.float32))
         batch = {k: v.to(self.device) for k, v in batch.items()}
         outputs = self.model(**batch)
         token_embeddings = outputs.last_hidden_state
@@ -0,0 +1,212 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import json
+import os
+import threading
+import numpy as np
+import hnswlib
+from config import settings
+
+
+def _index_paths(embed_path: Optional[str] = None) -> Tuple[Path, Path]:
+    embed = Path(embed_path or settings.embed_cache)
+    return embed.with_suffix(".hnsw.bin"), embed.with_suffix(".hnsw.json")
+
+
+class _ReadWriteLock:
+    """Many concurrent readers or one writer; waiting writers block new readers so syncs are not starved."""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class HnswIndex:
+    """HNSW graph over the normalized corpus matrix, labelled by a stable per-document integer.
+
+    Labels survive corpus syncs, so upserts and deletes are applied in place
+    instead of rebuilding the graph. `rows_for(meta)` maps labels back to the
+    row positions of a given snapshot. hnswlib does not allow queries while the
+    graph is resized, grown or marked, so queries share a read lock and
+    upserts/deletes take it exclusively.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        m: Optional[int] = None,
+        ef_construction: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        capacity: int = 1024,
+    ):
+        self.dim = dim
+        self.m = m or settings.hnsw_m
+        self.ef_construction = ef_construction or settings.hnsw_ef_construction
+        self.ef_search = ef_search or settings.hnsw_ef_search
+        self.index = hnswlib.Index(space="ip", dim=dim)
+        self.index.init_index(max_elements=max(capacity, 1), M=self.m, ef_construction=self.ef_construction)
+        self.index.set_ef(self.ef_search)
+        self.label_of: Dict[Any, int] = {}
+        self.ids: List[Any] = []
+        self.live = 0
+        self._lock = _ReadWriteLock()
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, meta: Sequence[dict], **params: Any) -> "HnswIndex":
+        n = int(matrix.shape[0])
+        idx = cls(int(matrix.shape[1]), capacity=int(n * 1.25) + 1024, **params)
+        idx.upsert([m["id"] for m in meta], matrix)
+        return idx
+
+    def set_ef(self, ef_search: int) -> None:
+        with self._lock.write():
+            self.ef_search = ef_search
+            self.index.set_ef(ef_search)
+
+    def upsert(self, ids: Sequence[Any], vectors: np.ndarray) -> None:
+        if len(ids) == 0:
+            return
+        with self._lock.write():
+            labels = np.empty(len(ids), dtype=np.int64)
+            for i, doc_id in enumerate(ids):
+                label = self.label_of.get(doc_id)
+                if label is None:
+                    label = len(self.ids)
+                    self.label_of[doc_id] = label
+                    self.ids.append(doc_id)
+                    self.live += 1
+                elif self.ids[label] is None:
+                    # previously deleted; add_items un-deletes the label
+                    self.ids[label] = doc_id
+                    self.live += 1
+                labels[i] = label
+            needed = len(self.ids)
+            if needed > self.index.get_max_elements():
+                self.index.resize_index(int(needed * 1.25) + 1024)
+            self.index.add_items(np.ascontiguousarray(vectors, dtype=np.float32), labels)
+
+    def remove(self, ids: Sequence[Any]) -> None:
+        with self._lock.write():
+            for doc_id in ids:
+                label = self.label_of.get(doc_id)
+                if label is None or self.ids[label] is None:
+                    continue
+                self.index.mark_deleted(label)
+                self.ids[label] = None
+                self.live -= 1
+
+    def rows_for(self, meta: Sequence[dict]) -> np.ndarray:
+        with self._lock.read():
+            rows = np.full(len(self.ids), -1, dtype=np.int64)
+            for i, m in enumerate(meta):
+                label = self.label_of.get(m["id"])
+                if label is not None:
+                    rows[label] = i
+        return rows
+
+    def search(self, q: np.ndarray, k: int, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (snapshot row indices, cosine similarities) of the approximate top-k."""
+        with self._lock.read():
+            k = min(k, self.live)
+            if k <= 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            # hnswlib searches with max(ef, k), so a large k needs no ef bump here
+            labels, dists = self.index.knn_query(np.asarray(q, dtype=np.float32).reshape(1, -1), k=k)
+        labels = labels[0].astype(np.int64)
+        sims = 1.0 - dists[0]
+        # labels added after this snapshot was taken have no row in it
+        in_range = labels < rows.shape[0]
+        labels, sims = labels[in_range], sims[in_range]
+        found = rows[labels]
+        keep = found >= 0
+        return found[keep], sims[keep].astype(np.float32)
+
+    def search_many(self, queries: np.ndarray, k: int, rows: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+        with self._lock.read():
+            k = min(k, self.live)
+            if k <= 0:
+                return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in range(len(queries))]
+            labels, dists = self.index.knn_query(np.asarray(queries, dtype=np.float32), k=k)
+        out = []
+        for lab, dist in zip(labels.astype(np.int64), dists):
+            in_range = lab < rows.shape[0]
+            found = rows[lab[in_range]]
+            keep = found >= 0
+            out.append((found[keep], (1.0 - dist[in_range])[keep].astype(np.float32)))
+        return out
+
+    def save(self, corpus_sha256: str, embed_path: Optional[str] = None) -> None:
+        bin_path, meta_path = _index_paths(embed_path)
+        bin_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_bin = bin_path.with_name(bin_path.name + ".tmp")
+        tmp_meta = meta_path.with_name(meta_path.name + ".tmp")
+        # a shared lock is enough: saving only reads the graph, and upserts wait until it is on disk
+        with self._lock.read():
+            self.index.save_index(str(tmp_bin))
+            info = {
+                "corpus_sha256": corpus_sha256,
+                "dim": self.dim,
+                "m": self.m,
+                "ef_construction": self.ef_construction,
+                "ids": self.ids,
+            }
+        tmp_meta.write_text(json.dumps(info), encoding="utf-8")
+        os.replace(tmp_bin, bin_path)
+        os.replace(tmp_meta, meta_path)
+
+    @classmethod
+    def load(cls, corpus_sha256: str, embed_path: Optional[str] = None) -> Optional["HnswIndex"]:
+        """Load the persisted graph if it was built for the cached matrix with this checksum."""
+        bin_path, meta_path = _index_paths(embed_path)
+        try:
+            info = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if info.get("corpus_sha256") != corpus_sha256 or not bin_path.exists():
+            return None
+        idx = cls.__new__(cls)
+        idx.dim = info["dim"]
+        idx.m = info["m"]
+        idx.ef_construction = info["ef_construction"]
+        idx.ef_search = settings.hnsw_ef_search
+        idx.index = hnswlib.Index(space="ip", dim=idx.dim)
+        idx.index.load_index(str(bin_path), max_elements=int(len(info["ids"]) * 1.25) + 1024)
+        idx.index.set_ef(idx.ef_search)
+        idx.ids = info["ids"]
+        idx.label_of = {doc_id: label for label, doc_id in enumerate(idx.ids) if doc_id is not None}
+        idx.live = len(idx.label_of)
+        idx._lock = _ReadWriteLock()
+        return idx
@@ -0,0 +1,152 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+from config import settings
+
+
+@dataclass
+class LoadStats:
+    rows: int = 0
+    pages: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "pages": self.pages,
+            "retries": self.retries,
+            "seconds": round(self.seconds, 3),
+            "rows_per_s": round(self.rows_per_s, 1),
+        }
+
+
+class BulkLoadError(RuntimeError):
+    """A page kept failing; calling `load()` again on the same loader resumes from the last good page."""
+
+
+@dataclass
+class _Range:
+    # keyset cursor over (lo, hi]; lo=None means from the very first key
+    lo: Any
+    hi: Any
+    rows: List[dict] = field(default_factory=list)
+    done: bool = False
+
+
+class BulkLoader:
+    """Keyset-paginated, concurrent full read of the documents table.
+
+    Integer ids are split into contiguous key ranges that are paged in
+    parallel (`WHERE id > cursor AND id <= hi ORDER BY id LIMIT page`), so
+    every request is an index range scan no matter how deep it is. Other id
+    types fall back to a single keyset stream. Each range remembers its cursor,
+    so a failed page is retried and, if it still fails, a later `load()` call
+    picks up where it stopped instead of starting over.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        columns: str,
+        page_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        max_retries: int = 3,
+    ):
+        self.client = client
+        self.columns = columns
+        self.page_size = page_size or settings.load_page_size
+        self.workers = max(1, workers or settings.load_workers)
+        self.max_retries = max_retries
+        self.stats = LoadStats()
+        self._ranges: List[_Range] | None = None
+        self._lock = threading.Lock()
+
+    def load(self) -> List[dict]:
+        started = time.perf_counter()
+        try:
+            if self._ranges is None:
+                self._ranges = self._plan()
+            pending = [r for r in self._ranges if not r.done]
+            if len(pending) == 1 or self.workers == 1:
+                for r in pending:
+                    self._drain(r)
+            else:
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="corpus-load") as pool:
+                    # list() re-raises the first failure
+                    list(pool.map(self._drain, pending))
+        finally:
+            self.stats.seconds += time.perf_counter() - started
+        rows: List[dict] = []
+        for r in self._ranges:
+            rows.extend(r.rows)
+        return rows
+
+    def _query(self):
+        return self.client.table(settings.table_name).select(self.columns)
+
+    def _edge(self, desc: bool) -> Any:
+        resp = self.client.table(settings.table_name).select(settings.id_column).order(
+            settings.id_column, desc=desc
+        ).limit(1).execute()
+        data = resp.data or []
+        return data[0].get(settings.id_column) if data else None
+
+    def _plan(self) -> List[_Range]:
+        lo, hi = self._edge(desc=False), self._edge(desc=True)
+        if lo is None:
+            return [_Range(None, None, done=True)]
+        if not isinstance(lo, int) or not isinstance(hi, int) or self.workers == 1:
+            return [_Range(None, None)]
+        # Several ranges per worker keep the pool busy when ids are unevenly dense
+        parts = max(1, min(self.workers * 4, (hi - lo) // self.page_size + 1))
+        step = (hi - lo + 1) / parts
+        bounds = [lo - 1] + [lo - 1 + int(round(step * (i + 1))) for i in range(parts)]
+        bounds[-1] = hi
+        return [_Range(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i + 1] > bounds[i]]
+
+    def _page(self, r: _Range) -> List[dict]:
+        query = self._query()
+        if r.lo is not None:
+            query = query.gt(settings.id_column, r.lo)
+        if r.hi is not None:
+            query = query.lte(settings.id_column, r.hi)
+        resp = query.order(settings.id_column).limit(self.page_size).execute()
+        return resp.data or []
+
+    def _drain(self, r: _Range) -> None:
+        while not r.done:
+            batch = self._fetch_with_retry(r)
+            r.rows.extend(batch)
+            if batch:
+                r.lo = batch[-1].get(settings.id_column)
+            with self._lock:
+                self.stats.rows += len(batch)
+                self.stats.pages += 1
+            if len(batch) < self.page_size:
+                r.done = True
+
+    def _fetch_with_retry(self, r: _Range) -> List[dict]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._page(r)
+            except Exception as exc:
+                if attempt == self.max_retries:
+                    raise BulkLoadError(f"Page after {settings.id_column}={r.lo!r} failed: {exc}") from exc
+                with self._lock:
+                    self.stats.retries += 1
+                time.sleep(min(0.2 * 2 ** attempt, 5.0))
+        return []
+
+    def progress(self) -> Tuple[int, int]:
+        """(finished ranges, total ranges)"""
+        if self._ranges is None:
+            return 0, 0
+        return sum(r.done for r in self._ranges), len(self._ranges)
@@ -0,0 +1,117 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Optional
+import inspect
+import os
+import numpy as np
+import torch
+from config import settings
+
+ONNX_BACKENDS = ("onnx", "onnx-int8")
+# Minimum per-row cosine between ONNX and torch mean-pooled embeddings (checked by `benchmark.py embed` and the parity test)
+PARITY_MIN_COSINE = {"onnx": 0.9999, "onnx-int8": 0.99}
+# Minimum per-query Spearman correlation between ONNX and torch cross-encoder scores, and the largest absolute
+# score difference allowed for fp32 (checked by `benchmark.py rerank` and rag_pipeline/tests/test_onnx_parity.py)
+PARITY_MIN_SPEARMAN = {"onnx": 0.9999, "onnx-int8": 0.95}
+PARITY_MAX_SCORE_DIFF = {"onnx": 1e-3}
+
+
+class _Output(torch.nn.Module):
+    # Export a single output tensor: last_hidden_state for the embedder (mean pooling stays in numpy so both
+    # backends pool identically), logits for the cross-encoder
+    def __init__(self, model: torch.nn.Module, output: str):
+        super().__init__()
+        self.model = model
+        self.output = output
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, token_type_ids: Optional[torch.Tensor] = None) -> torch.Tensor:
+        kwargs = {} if token_type_ids is None else {"token_type_ids": token_type_ids}
+        return getattr(self.model(input_ids=input_ids, attention_mask=attention_mask, **kwargs), self.output)
+
+
+def model_path(model_name: str, backend: str, onnx_dir: Optional[str] = None) -> Path:
+    base = Path(onnx_dir or settings.onnx_dir) / model_name.replace("/", "__")
+    return base / ("model.int8.onnx" if backend == "onnx-int8" else "model.onnx")
+
+
+def export(model: torch.nn.Module, path: Path, output: str = "last_hidden_state", token_type_ids: bool = False) -> Path:
+    """Write `model` (a transformers model) as an fp32 ONNX graph with dynamic batch and sequence axes.
+
+    `output` names the model output to export; `token_type_ids` adds that input (BERT-style pair encoders).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    inputs = ["input_ids", "attention_mask"] + (["token_type_ids"] if token_type_ids else [])
+    dummy = tuple(torch.zeros(2, 8, dtype=torch.long) if name == "token_type_ids" else torch.ones(2, 8, dtype=torch.long) for name in inputs)
+    dynamic_axes = {name: {0: "batch", 1: "seq"} for name in inputs}
+    dynamic_axes[output] = {0: "batch"} if output == "logits" else {0: "batch", 1: "seq"}
+    # torch >= 2.5 takes `dynamo` (and may default it to True); the TorchScript exporter is what handles dynamic_axes
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            _Output(model.cpu().eval(), output),
+            dummy,
+            str(tmp),
+            input_names=inputs,
+            output_names=[output],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            **extra,
+        )
+    os.replace(tmp, path)
+    return path
+
+
+def quantize(fp32_path: Path, int8_path: Path) -> Path:
+    """Dynamic int8 quantization: int8 weights, activations quantized per batch at run time."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp = int8_path.with_name(int8_path.name + ".tmp")
+    quantize_dynamic(str(fp32_path), str(tmp), weight_type=QuantType.QInt8)
+    os.replace(tmp, int8_path)
+    return int8_path
+
+
+def ensure_model(model_name: str, backend: str, load_model: Any, onnx_dir: Optional[str] = None, **export_args: Any) -> Path:
+    """Path of the ONNX graph for `backend`, exporting (and quantizing) it on first use.
+
+    `load_model()` returns the torch model; it is only called when an export is needed.
+    `export_args` are passed to `export`.
+    """
+    path = model_path(model_name, backend, onnx_dir)
+    if path.exists():
+        return path
+    fp32 = model_path(model_name, "onnx", onnx_dir)
+    if not fp32.exists():
+        print(f"Exporting {model_name} to {fp32}")
+        export(load_model(), fp32, **export_args)
+    if backend == "onnx-int8":
+        print(f"Quantizing {fp32} to {path}")
+        quantize(fp32, path)
+    return path
+
+
+class OnnxEncoder:
+    """ONNX Runtime session returning the graph's single output (last_hidden_state or logits) for tokenized input."""
+
+    def __init__(self, path: Path, threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = threads or settings.onnx_threads
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.output_name = self.session.get_outputs()[0].name
+
+    def __call__(self, input_ids: np.ndarray, attention_mask: np.ndarray, token_type_ids: Optional[np.ndarray] = None) -> np.ndarray:
+        feeds = {
+            "input_ids": np.ascontiguousarray(input_ids, dtype=np.int64),
+            "attention_mask": np.ascontiguousarray(attention_mask, dtype=np.int64),
+        }
+        if "token_type_ids" in self.input_names:
+            types = np.zeros_like(feeds["input_ids"]) if token_type_ids is None else token_type_ids
+            feeds["token_type_ids"] = np.ascontiguousarray(types, dtype=np.int64)
+        return self.session.run([self.output_name], feeds)[0]
@@ -0,0 +1,31 @@
+from __future__ import annotations
+from typing import Any, List, Tuple
+import numpy as np
+from psycopg2 import sql
+from config import settings
+from vendors.postgres_client import connection
+
+
+class PgVectorSearch:
+    """Top-k cosine search executed by Postgres; only the k winning rows cross the network."""
+
+    def __init__(self, table: str | None = None):
+        table_name = table or settings.table_name
+        self.query = sql.SQL(
+            "SELECT {id}, {content}, 1 - ({vec} <=> %(q)s) AS similarity "
+            "FROM {table} WHERE {vec} IS NOT NULL "
+            "ORDER BY {vec} <=> %(q)s LIMIT %(k)s"
+        ).format(
+            id=sql.Identifier(settings.id_column),
+            content=sql.Identifier(settings.content_column),
+            vec=sql.Identifier(settings.vector_column),
+            table=sql.Identifier(*table_name.split(".")),
+        )
+
+    def search(self, q: np.ndarray, k: int) -> List[Tuple[Any, str, float]]:
+        with connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(self.query, {"q": np.asarray(q, dtype=np.float32), "k": int(k)})
+                rows = cur.fetchall()
+            conn.rollback()
+        return [(r[0], r[1] or "", float(r[2])) for r in rows]
@@ -0,0 +1,331 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional, Tuple
+import os
+import numpy as np
+from config import settings
+from retrieval.scan import top_k
+
+
+BLOCK_ROWS = 16384
+# Scan blocks are sized so the decoded block stays in cache; large blocks make the scan memory-bound again
+INT8_SCAN_ROWS = 256
+PQ_SCAN_ROWS = 512
+BINARY_SCAN_ROWS = 8192
+# bits set in each byte value; fallback for numpy < 2.0 (no np.bitwise_count)
+_POPCOUNT8 = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+class ScalarQuantizer:
+    """Per-dimension affine int8 codes: x ~= lo + scale * (code + 128)."""
+
+    kind = "int8"
+
+    def __init__(self, lo: np.ndarray, scale: np.ndarray):
+        self.lo = lo.astype(np.float32)
+        self.scale = scale.astype(np.float32)
+
+    @classmethod
+    def fit(cls, mat: np.ndarray) -> "ScalarQuantizer":
+        lo = np.asarray(mat.min(axis=0), dtype=np.float32)
+        hi = np.asarray(mat.max(axis=0), dtype=np.float32)
+        scale = np.maximum(hi - lo, 1e-12) / 255.0
+        return cls(lo, scale)
+
+    def encode(self, mat: np.ndarray) -> np.ndarray:
+        codes = np.empty(mat.shape, dtype=np.int8)
+        for start in range(0, mat.shape[0], BLOCK_ROWS):
+            block = np.asarray(mat[start:start + BLOCK_ROWS], dtype=np.float32)
+            q = np.rint((block - self.lo) / self.scale) - 128.0
+            codes[start:start + BLOCK_ROWS] = np.clip(q, -128, 127).astype(np.int8)
+        return codes
+
+    def scores(self, codes: np.ndarray, q: np.ndarray) -> np.ndarray:
+        # x.q = lo.q + 128 * (scale*q).sum() + codes @ (scale*q)
+        qs = (self.scale * q).astype(np.float32)
+        offset = float(self.lo @ q) + 128.0 * float(qs.sum())
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        buf = np.empty((INT8_SCAN_ROWS, codes.shape[1]), dtype=np.float32)
+        for start in range(0, codes.shape[0], INT8_SCAN_ROWS):
+            block = codes[start:start + INT8_SCAN_ROWS]
+            decoded = buf[: block.shape[0]]
+            np.copyto(decoded, block, casting="unsafe")
+            np.dot(decoded, qs, out=out[start:start + INT8_SCAN_ROWS])
+        out += offset
+        return out
+
+    def matches_settings(self) -> bool:
+        return True
+
+    def state(self) -> dict:
+        return {"lo": self.lo, "scale": self.scale}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "ScalarQuantizer":
+        return cls(state["lo"], state["scale"])
+
+
+class ProductQuantizer:
+    """Split each vector into `m` sub-vectors and store the id of the nearest of 256 centroids per sub-vector."""
+
+    kind = "pq"
+
+    def __init__(self, centroids: np.ndarray):
+        # (m, 256, dsub)
+        self.centroids = centroids.astype(np.float32)
+
+    @property
+    def m(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @classmethod
+    def fit(cls, mat: np.ndarray, m: Optional[int] = None, iters: int = 20, sample: int = 25000, seed: int = 0) -> "ProductQuantizer":
+        m = m or settings.pq_subspaces
+        dim = mat.shape[1]
+        if dim % m != 0:
+            raise ValueError(f"PQ sub-spaces ({m}) must divide the vector dimension ({dim})")
+        rng = np.random.default_rng(seed)
+        n = mat.shape[0]
+        picks = np.sort(rng.choice(n, size=min(n, sample), replace=False))
+        train = np.asarray(mat[picks], dtype=np.float32)
+        dsub = dim // m
+        ks = min(256, train.shape[0])
+        centroids = np.zeros((m, 256, dsub), dtype=np.float32)
+        for j in range(m):
+            sub = train[:, j * dsub:(j + 1) * dsub]
+            centroids[j, :ks] = _kmeans(sub, ks, iters, rng)
+        return cls(centroids)
+
+    def encode(self, mat: np.ndarray) -> np.ndarray:
+        m, _, dsub = self.centroids.shape
+        codes = np.empty((mat.shape[0], m), dtype=np.uint8)
+        c_norms = (self.centroids ** 2).sum(axis=2)
+        for start in range(0, mat.shape[0], BLOCK_ROWS):
+            block = np.asarray(mat[start:start + BLOCK_ROWS], dtype=np.float32)
+            for j in range(m):
+                sub = block[:, j * dsub:(j + 1) * dsub]
+                # argmin ||x - c||^2 == argmin ||c||^2 - 2 x.c
+                d = c_norms[j][None, :] - 2.0 * (sub @ self.centroids[j].T)
+                codes[start:start + BLOCK_ROWS, j] = d.argmin(axis=1)
+        return codes
+
+    def scores(self, codes: np.ndarray, q: np.ndarray) -> np.ndarray:
+        m, _, dsub = self.centroids.shape
+        # asymmetric distance: one (m, 256) lookup table of q_sub . centroid
+        table = np.einsum("jkd,jd->jk", self.centroids, q.reshape(m, dsub).astype(np.float32))
+        flat = table.ravel()
+        offsets = np.arange(m, dtype=np.intp) * table.shape[1]
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], PQ_SCAN_ROWS):
+            idx = codes[start:start + PQ_SCAN_ROWS].astype(np.intp)
+            idx += offsets
+            out[start:start + PQ_SCAN_ROWS] = flat.take(idx).sum(axis=1)
+        return out
+
+    def matches_settings(self) -> bool:
+        return self.m == settings.pq_subspaces
+
+    def state(self) -> dict:
+        return {"centroids": self.centroids}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "ProductQuantizer":
+        return cls(state["centroids"])
+
+
+class BinaryQuantizer:
+    """One sign bit per dimension of x - mean, packed into uint64 words; compared with Hamming distance."""
+
+    kind = "binary"
+
+    def __init__(self, mean: np.ndarray):
+        # centring first matters: raw transformer embeddings share a large common direction
+        self.mean = mean.astype(np.float32)
+
+    @property
+    def words(self) -> int:
+        return (self.mean.shape[0] + 63) // 64
+
+    @classmethod
+    def fit(cls, mat: np.ndarray, sample: int = 50000, seed: int = 0) -> "BinaryQuantizer":
+        n = mat.shape[0]
+        picks = np.sort(np.random.default_rng(seed).choice(n, size=min(n, sample), replace=False))
+        return cls(np.asarray(mat[picks], dtype=np.float32).mean(axis=0))
+
+    def _pack(self, block: np.ndarray) -> np.ndarray:
+        bits = np.packbits(block > self.mean, axis=1)
+        padded = np.zeros((block.shape[0], self.words * 8), dtype=np.uint8)
+        padded[:, :bits.shape[1]] = bits
+        return padded.view(np.uint64)
+
+    def encode(self, mat: np.ndarray) -> np.ndarray:
+        codes = np.empty((mat.shape[0], self.words), dtype=np.uint64)
+        for start in range(0, mat.shape[0], BLOCK_ROWS):
+            codes[start:start + BLOCK_ROWS] = self._pack(np.asarray(mat[start:start + BLOCK_ROWS], dtype=np.float32))
+        return codes
+
+    def scores(self, codes: np.ndarray, q: np.ndarray) -> np.ndarray:
+        # dim - 2 * hamming: the number of agreeing minus disagreeing signs, so higher is closer
+        qcode = self._pack(np.asarray(q, dtype=np.float32)[None, :])[0]
+        dim = self.mean.shape[0]
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], BINARY_SCAN_ROWS):
+            diff = np.bitwise_xor(codes[start:start + BINARY_SCAN_ROWS], qcode)
+            if hasattr(np, "bitwise_count"):
+                ham = np.bitwise_count(diff).sum(axis=1, dtype=np.int32)
+            else:
+                ham = _POPCOUNT8[diff.view(np.uint8)].sum(axis=1, dtype=np.int32)
+            out[start:start + BINARY_SCAN_ROWS] = dim - 2 * ham
+        return out
+
+    def matches_settings(self) -> bool:
+        return True
+
+    def state(self) -> dict:
+        return {"mean": self.mean}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "BinaryQuantizer":
+        return cls(state["mean"])
+
+
+class PcaProjector:
+    """Project vectors onto the top `dim` principal components of the corpus: x ~= mean + components.T @ code."""
+
+    kind = "pca"
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray):
+        self.mean = mean.astype(np.float32)
+        # (dim, d), rows orthonormal
+        self.components = components.astype(np.float32)
+
+    @property
+    def dim(self) -> int:
+        return int(self.components.shape[0])
+
+    @classmethod
+    def fit(cls, mat: np.ndarray, dim: Optional[int] = None, sample: int = 50000, seed: int = 0) -> "PcaProjector":
+        dim = dim or settings.pca_dim
+        if not 0 < dim < mat.shape[1]:
+            raise ValueError(f"PCA_DIM ({dim}) must be between 1 and the vector dimension ({mat.shape[1]})")
+        n = mat.shape[0]
+        picks = np.sort(np.random.default_rng(seed).choice(n, size=min(n, sample), replace=False))
+        train = np.asarray(mat[picks], dtype=np.float64)
+        mean = train.mean(axis=0)
+        train -= mean
+        # eigh returns ascending eigenvalues; keep the largest `dim`
+        _, vecs = np.linalg.eigh(train.T @ train)
+        return cls(mean, vecs[:, ::-1][:, :dim].T)
+
+    def encode(self, mat: np.ndarray) -> np.ndarray:
+        codes = np.empty((mat.shape[0], self.dim), dtype=np.float32)
+        for start in range(0, mat.shape[0], BLOCK_ROWS):
+            block = np.asarray(mat[start:start + BLOCK_ROWS], dtype=np.float32)
+            np.dot(block - self.mean, self.components.T, out=codes[start:start + BLOCK_ROWS])
+        return codes
+
+    def scores(self, codes: np.ndarray, q: np.ndarray) -> np.ndarray:
+        # x.q ~= mean.q + code.(components @ q); the residual outside the subspace is dropped
+        out = codes @ (self.components @ q).astype(np.float32)
+        out += float(self.mean @ q)
+        return out
+
+    def matches_settings(self) -> bool:
+        return self.dim == settings.pca_dim
+
+    def state(self) -> dict:
+        return {"mean": self.mean, "components": self.components}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "PcaProjector":
+        return cls(state["mean"], state["components"])
+
+
+def _kmeans(x: np.ndarray, k: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = x[rng.choice(x.shape[0], size=k, replace=False)].copy()
+    x_norms = (x ** 2).sum(axis=1)
+    for _ in range(iters):
+        d = x_norms[:, None] - 2.0 * (x @ centers.T) + (centers ** 2).sum(axis=1)[None, :]
+        assign = d.argmin(axis=1)
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0
+        # per-cluster sums via one sort + reduceat (np.add.at is far slower)
+        order = np.argsort(assign, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        centers[filled] = sums / counts[filled, None]
+        # re-seed empty clusters from random points
+        empty = np.flatnonzero(~filled)
+        if empty.size:
+            centers[empty] = x[rng.choice(x.shape[0], size=empty.size, replace=False)]
+    return centers
+
+
+_QUANTIZERS = {"int8": ScalarQuantizer, "pq": ProductQuantizer, "pca": PcaProjector, "binary": BinaryQuantizer}
+
+
+@dataclass(frozen=True)
+class QuantizedMatrix:
+    quantizer: ScalarQuantizer | ProductQuantizer | PcaProjector | BinaryQuantizer
+    codes: np.ndarray
+
+    @classmethod
+    def build(cls, kind: str, mat: np.ndarray, **fit_args: Any) -> "QuantizedMatrix":
+        quantizer = _QUANTIZERS[kind].fit(mat, **fit_args)
+        return cls(quantizer, quantizer.encode(mat))
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes)
+
+    def extend(self, keep: np.ndarray, fresh: np.ndarray) -> "QuantizedMatrix":
+        # Reuse the existing codebook; only new rows are encoded
+        parts = [self.codes[keep]]
+        if fresh.shape[0]:
+            parts.append(self.quantizer.encode(fresh))
+        return QuantizedMatrix(self.quantizer, np.concatenate(parts, axis=0))
+
+    def search(self, q: np.ndarray, k: int, matrix: np.ndarray, rescore: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate scan over the codes, then exact float re-scoring of the best `rescore` rows."""
+        n = self.codes.shape[0]
+        if n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        approx = self.quantizer.scores(self.codes, q)
+        if not rescore:
+            # sign bits alone rank coarsely, so the binary first pass hands over more candidates
+            rescore = settings.binary_rescore_candidates if self.quantizer.kind == "binary" else settings.rescore_candidates
+        r = min(n, max(k, rescore))
+        cand = np.argpartition(-approx, r - 1)[:r] if r < n else np.arange(n)
+        # sorted gather keeps reads from the memory-mapped matrix sequential
+        cand.sort()
+        exact = np.asarray(matrix[cand], dtype=np.float32) @ q
+        return top_k(cand, exact, k)
+
+    def save(self, corpus_sha256: str, embed_path: Optional[str] = None) -> None:
+        path = _codes_path(self.quantizer.kind, embed_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, codes=self.codes, corpus_sha256=np.array(corpus_sha256), **self.quantizer.state())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, kind: str, corpus_sha256: str, embed_path: Optional[str] = None) -> Optional["QuantizedMatrix"]:
+        path = _codes_path(kind, embed_path)
+        try:
+            with np.load(path) as data:
+                if str(data["corpus_sha256"]) != corpus_sha256:
+                    return None
+                state = {key: data[key] for key in data.files if key not in ("codes", "corpus_sha256")}
+                quantizer = _QUANTIZERS[kind].from_state(state)
+                # fitted with another PCA_DIM / PQ_SUBSPACES: rebuild rather than serve stale codes
+                if not quantizer.matches_settings():
+                    return None
+                return cls(quantizer, data["codes"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def _codes_path(kind: str, embed_path: Optional[str] = None) -> Path:
+    return Path(embed_path or settings.embed_cache).with_suffix(f".{kind}.npz")
@@ -0,0 +1,80 @@
+from __future__ import annotations
+from typing import Optional, Tuple
+import numpy as np
+from config import settings
+
+
+def _best(idx: np.ndarray, sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # unordered best k
+    if sims.shape[0] <= k:
+        return idx, sims
+    part = np.argpartition(-sims, k - 1)[:k]
+    return idx[part], sims[part]
+
+
+def top_k(idx: np.ndarray, sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k of (idx, sims) in descending order, using argpartition instead of a full sort."""
+    idx, sims = _best(idx, sims, k)
+    order = np.argsort(-sims, kind="stable")
+    return idx[order], sims[order]
+
+
+def blocked_topk(
+    matrix: np.ndarray, q: np.ndarray, k: int, block_rows: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact top-k cosine over `matrix` streamed in fixed-size row blocks.
+
+    Peak extra memory is one block of scores plus 2k candidates, so a memory-mapped
+    corpus far larger than RAM can be scanned with one GEMV per block.
+    """
+    n = int(matrix.shape[0])
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    block_rows = max(block_rows or settings.scan_block_rows, k)
+    q = np.asarray(q, dtype=np.float32)
+    best_idx = np.zeros(0, dtype=np.int64)
+    best_sims = np.zeros(0, dtype=np.float32)
+    for start in range(0, n, block_rows):
+        sims = np.asarray(matrix[start:start + block_rows]) @ q
+        idx, sims = _best(np.arange(start, start + sims.shape[0], dtype=np.int64), sims, k)
+        best_idx, best_sims = _best(np.concatenate((best_idx, idx)), np.concatenate((best_sims, sims)), k)
+    return top_k(best_idx, best_sims, k)
+
+
+def _best_cols(idx: np.ndarray, sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # unordered best k per column of (rows, queries) arrays
+    if sims.shape[0] <= k:
+        return idx, sims
+    part = np.argpartition(-sims, k - 1, axis=0)[:k]
+    return np.take_along_axis(idx, part, axis=0), np.take_along_axis(sims, part, axis=0)
+
+
+def blocked_topk_many(
+    matrix: np.ndarray, queries: np.ndarray, k: int, block_rows: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact top-k for a batch of queries: one GEMM per block, per-query selection vectorized.
+
+    Returns (idx, sims), each shaped (len(queries), k) and sorted best first.
+    """
+    n = int(matrix.shape[0])
+    m = int(queries.shape[0])
+    k = min(k, n)
+    if k <= 0 or m == 0:
+        return np.zeros((m, 0), dtype=np.int64), np.zeros((m, 0), dtype=np.float32)
+    block_rows = max(block_rows or settings.scan_block_rows, k)
+    qt = np.ascontiguousarray(np.asarray(queries, dtype=np.float32).T)
+    best_idx = np.zeros((0, m), dtype=np.int64)
+    best_sims = np.zeros((0, m), dtype=np.float32)
+    for start in range(0, n, block_rows):
+        sims = np.asarray(matrix[start:start + block_rows]) @ qt
+        rows = np.arange(start, start + sims.shape[0], dtype=np.int64)
+        idx = np.broadcast_to(rows[:, None], sims.shape)
+        idx, sims = _best_cols(idx, sims, k)
+        best_idx, best_sims = _best_cols(
+            np.concatenate((best_idx, idx), axis=0), np.concatenate((best_sims, sims), axis=0), k
+        )
+    order = np.argsort(-best_sims, axis=0, kind="stable")
+    best_idx = np.take_along_axis(best_idx, order, axis=0)
+    best_sims = np.take_along_axis(best_sims, order, axis=0)
+    return best_idx.T, best_sims.T
@@ -1,43 +1,14 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List, Any
+from typing import List, Any, Tuple
+import threading
 import numpy as np
 import torch
 from config import settings
-from vendors.supabase_client import get_client
 from retrieval.embedder import CodeBERTEmbedder
-import json
-
-
-def _l2_normalize(x: np.ndarray) -> np.ndarray:
-    norms = np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
-    return x / norms
-
-
-def _parse_vector(value: Any) -> List[float] | None:
-    # Accept already-parsed list
-    if isinstance(value, list):
-        try:
-            return [float(x) for x in value]
-        except Exception:
-            return None
-    # Accept JSON/string formats like "[0.1, 0.2]" or "{0.1,0.2}"
-    if isinstance(value, str):
-        s = value.strip()
-        try:
-            # Try JSON first
-            if s.startswith("[") and s.endswith("]"):
-                arr = json.loads(s)
-                if isinstance(arr, list):
-                    return [float(x) for x in arr]
-            # Try pg array style {..}
-            if s.startswith("{") and s.endswith("}"):
-                inner = s[1:-1]
-                parts = [p for p in inner.split(",") if p]
-                return [float(p) for p in parts]
-        except Exception:
-            return None
-    return None
+from retrieval.store import QUANTIZED_MODES, CorpusSnapshot, CorpusStore, get_store
+from retrieval.scan import blocked_topk, blocked_topk_many
+from retrieval.vectors import l2_normalize
 
 
 @dataclass
@@ -48,61 +19,121 @@ class SearchResult:
 
 
 class Retriever:
-    def __init__(self, top_k: int = 5):
+    def __init__(self, top_k: int = 5, store: CorpusStore | None = None, backend: str | None = None):
         self.top_k = top_k
         self.embedder = CodeBERTEmbedder()
-        self.client = get_client()
+        self.backend = backend or settings.search_backend
+        # Postgres ranks in pgvector mode: no resident corpus is loaded or synced
+        self.store = store or (get_store() if self.backend == "memory" else None)
+        self.pgvector = None
+        self.shards = None
+        self._shards_lock = threading.Lock()
+        if self.backend == "pgvector":
+            # psycopg2 is only needed when Postgres does the ranking
+            from retrieval.pgvector_search import PgVectorSearch
+            self.pgvector = PgVectorSearch()
+        elif self.backend != "memory":
+            raise ValueError(f"Unknown search backend: {self.backend!r} (expected 'memory' or 'pgvector')")
 
-    def _fetch_documents(self) -> tuple[np.ndarray, list[dict]]:
-        rows: list[dict] = []
-        limit = 1000
-        offset = 0
-        while True:
-            resp = self.client.table(settings.table_name).select(
-                f"{settings.id_column},{settings.content_column},{settings.vector_column}"
-            ).range(offset, offset + limit - 1).execute()
-            batch = resp.data or []
-            rows.extend(batch)
-            if len(batch) < limit:
-                break
-            offset += limit
-        if not rows:
-            return np.zeros((0, 768), dtype=np.float32), []
-        vectors: list[list[float]] = []
-        metas: list[dict] = []
-        for r in rows:
-            vec_raw = r.get(settings.vector_column)
-            content = r.get(settings.content_column, "")
-            vec = _parse_vector(vec_raw)
-            if vec is None or len(vec) == 0:
-                continue
-            vectors.append(vec)
-            metas.append({
-                "id": r.get(settings.id_column),
-                "content": content,
-            })
-        if not vectors:
-            # No usable vectors parsed
-            return np.zeros((0, 768), dtype=np.float32), []
-        mat = np.asarray(vectors, dtype=np.float32)
-        mat = _l2_normalize(mat)
-        return mat, metas
+    def refresh(self) -> int:
+        if self.store is None:
+            raise RuntimeError(f"SEARCH_BACKEND={self.backend} has no resident corpus to refresh")
+        return self.store.refresh().version
 
     def _embed_query(self, query: str) -> np.ndarray:
-        embeddings: torch.Tensor = self.embedder.embed([query])
+        return self._embed_queries([query])
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        embeddings: torch.Tensor = self.embedder.embed_queries(queries)
         arr = embeddings.numpy().astype(np.float32)
-        arr = _l2_normalize(arr)
+        arr = l2_normalize(arr)
         return arr
 
-    def search(self, query: str) -> List[SearchResult]:
-        mat, meta = self._fetch_documents()
-        if mat.shape[0] == 0:
+    def search(self, query: str, top_k: int | None = None, mode: str | None = None) -> List[SearchResult]:
+        k = top_k or self.top_k
+        if self.pgvector is not None:
+            q = self._embed_query(query)[0]
+            return [SearchResult(id=i, content=c, similarity=s) for i, c, s in self.pgvector.search(q, k)]
+        snap = self.store.snapshot()
+        if len(snap) == 0:
             return []
         q = self._embed_query(query)[0]
-        sims = (mat @ q)
-        top_idx = np.argsort(-sims)[: self.top_k]
+        top_idx, top_sims = self._rank(snap, q, k, mode or settings.search_mode)
+        return self._results(snap, top_idx, top_sims)
+
+    def search_many(self, queries: List[str], top_k: int | None = None, mode: str | None = None) -> List[List[SearchResult]]:
+        """Search a batch of queries with one embedding forward pass and one scoring pass over the corpus."""
+        if not queries:
+            return []
+        k = top_k or self.top_k
+        if self.pgvector is not None:
+            qs = self._embed_queries(list(queries))
+            return [
+                [SearchResult(id=i, content=c, similarity=s) for i, c, s in self.pgvector.search(q, k)] for q in qs
+            ]
+        snap = self.store.snapshot()
+        if len(snap) == 0:
+            return [[] for _ in queries]
+        qs = self._embed_queries(list(queries))
+        mode = mode or settings.search_mode
+        if mode == "exact" or (mode == "hnsw" and snap.ann is None):
+            idx, sims = blocked_topk_many(snap.matrix, qs, k)
+            ranked = list(zip(idx, sims))
+        elif mode == "hnsw":
+            ranked = snap.ann.search_many(qs, k, snap.ann_rows)
+        elif mode == "sharded":
+            found = self._sharded(snap, "search_many", qs, k)
+            if found is None:
+                found = blocked_topk_many(snap.matrix, qs, k)
+            ranked = list(zip(*found))
+        else:
+            ranked = [self._rank(snap, q, k, mode) for q in qs]
+        return [self._results(snap, i, s) for i, s in ranked]
+
+    @staticmethod
+    def _results(snap: CorpusSnapshot, top_idx: np.ndarray, top_sims: np.ndarray) -> List[SearchResult]:
         results: List[SearchResult] = []
-        for i in top_idx:
-            m = meta[int(i)]
-            results.append(SearchResult(id=m["id"], content=m["content"], similarity=float(sims[int(i)])))
+        for i, sim in zip(top_idx, top_sims):
+            m = snap.meta[int(i)]
+            results.append(SearchResult(id=m["id"], content=m["content"], similarity=float(sim)))
         return results
+
+    def _rank(self, snap: CorpusSnapshot, q: np.ndarray, k: int, mode: str) -> Tuple[np.ndarray, np.ndarray]:
+        if mode == "hnsw":
+            if snap.ann is not None:
+                return snap.ann.search(q, k, snap.ann_rows)
+        elif mode in QUANTIZED_MODES:
+            if snap.quantized is not None:
+                return snap.quantized.search(q, k, snap.matrix)
+        elif mode == "sharded":
+            found = self._sharded(snap, "search", q, k)
+            if found is not None:
+                return found
+        elif mode != "exact":
+            raise ValueError(f"Unknown search mode: {mode!r} (expected 'exact', 'hnsw', 'int8', 'pq', 'pca', 'binary' or 'sharded')")
+        return blocked_topk(snap.matrix, q, k)
+
+    def _sharded(self, snap: CorpusSnapshot, op: str, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray] | None:
+        # None -> caller scans in-process (workers on another snapshot, or a worker died)
+        if self.shards is None:
+            with self._shards_lock:
+                if self.shards is None:
+                    from retrieval.shards import ShardPool
+                    self.shards = ShardPool()
+        shards = self.shards
+        try:
+            shards.load(snap.matrix, snap.version)
+            return getattr(shards, op)(q, k, snap.version)
+        except (RuntimeError, OSError, EOFError) as exc:
+            print(f"Sharded search failed, scanning in-process: {exc}")
+            # a dead worker leaves a broken pipe; the next sharded search starts a fresh pool
+            with self._shards_lock:
+                if self.shards is shards:
+                    self.shards = None
+            shards.close()
+            return None
+
+    def close(self) -> None:
+        if self.shards is not None:
+            self.shards.close()
+            self.shards = None
@@ -0,0 +1,127 @@
+from __future__ import annotations
+from typing import Any, Iterator, List, Sequence
+import numpy as np
+
+
+class SegmentedMatrix:
+    """Rows `rows` of a read-only base matrix (usually the memory-mapped cache), followed by an in-memory tail.
+
+    Delta syncs build one of these instead of copying the corpus: rows that were
+    updated or deleted are left out of `rows`, new and changed vectors go to the
+    tail. Supports what the search paths use on a matrix (`shape`, row slices,
+    integer gathers, `np.asarray`); slices are gathered per block, so a scan over
+    a memory-mapped base still streams it.
+    """
+
+    def __init__(self, base: np.ndarray, rows: np.ndarray, tail: np.ndarray):
+        self.base = base
+        self.rows = rows
+        self.tail = tail
+        self.dtype = np.dtype(np.float32)
+
+    @classmethod
+    def over(cls, matrix: np.ndarray) -> "SegmentedMatrix":
+        if isinstance(matrix, SegmentedMatrix):
+            return matrix
+        n, dim = int(matrix.shape[0]), int(matrix.shape[1])
+        return cls(matrix, np.arange(n, dtype=np.int64), np.zeros((0, dim), dtype=np.float32))
+
+    @property
+    def shape(self) -> tuple:
+        return (int(self.rows.shape[0]) + int(self.tail.shape[0]), int(self.base.shape[1]))
+
+    @property
+    def nbytes(self) -> int:
+        # what this view keeps in RAM; a memory-mapped base lives in the page cache
+        base = 0 if isinstance(self.base, np.memmap) else int(self.base.nbytes)
+        return base + int(self.rows.nbytes) + int(self.tail.nbytes)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key: Any) -> np.ndarray:
+        nb = int(self.rows.shape[0])
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return self[np.arange(start, stop, step)]
+            parts = []
+            if start < nb:
+                rows = self.rows[start:min(stop, nb)]
+                if rows.shape[0] and int(rows[-1]) - int(rows[0]) == rows.shape[0] - 1:
+                    # rows ascend, so an unbroken run is a plain slice of the base: no copy
+                    parts.append(np.asarray(self.base[int(rows[0]):int(rows[-1]) + 1]))
+                else:
+                    parts.append(np.asarray(self.base[rows], dtype=np.float32))
+            if stop > nb:
+                parts.append(self.tail[max(start - nb, 0):stop - nb])
+            if len(parts) == 1:
+                return parts[0]
+            return np.concatenate(parts, axis=0) if parts else np.zeros((0, self.shape[1]), dtype=np.float32)
+        idx = np.asarray(key, dtype=np.int64)
+        if idx.ndim == 0:
+            i = int(idx) + len(self) if idx < 0 else int(idx)
+            return np.asarray(self.base[self.rows[i]] if i < nb else self.tail[i - nb], dtype=np.float32)
+        out = np.empty((idx.shape[0], self.shape[1]), dtype=np.float32)
+        lo = idx < nb
+        out[lo] = self.base[self.rows[idx[lo]]]
+        out[~lo] = self.tail[idx[~lo] - nb]
+        return out
+
+    def __array__(self, dtype: Any = None, copy: Any = None) -> np.ndarray:
+        out = self[0:len(self)]
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    def select(self, keep: np.ndarray) -> "SegmentedMatrix":
+        """Keep the rows at positions `keep` (ascending), without touching the base."""
+        nb = int(self.rows.shape[0])
+        split = int(np.searchsorted(keep, nb))
+        return SegmentedMatrix(self.base, self.rows[keep[:split]], self.tail[keep[split:] - nb])
+
+    def append(self, fresh: np.ndarray) -> "SegmentedMatrix":
+        if not fresh.shape[0]:
+            return self
+        tail = np.concatenate((self.tail, np.asarray(fresh, dtype=np.float32)), axis=0)
+        return SegmentedMatrix(self.base, self.rows, tail)
+
+
+class SegmentedMeta:
+    """The metadata counterpart of SegmentedMatrix: entries `rows` of a base sequence, then a tail list.
+
+    Keeps a MetaReader base on disk instead of decoding every line into a new list on each sync.
+    """
+
+    def __init__(self, base: Sequence[dict], rows: np.ndarray, tail: List[dict]):
+        self.base = base
+        self.rows = rows
+        self.tail = tail
+
+    @classmethod
+    def over(cls, meta: Sequence[dict]) -> "SegmentedMeta":
+        if isinstance(meta, SegmentedMeta):
+            return meta
+        return cls(meta, np.arange(len(meta), dtype=np.int64), [])
+
+    def __len__(self) -> int:
+        return int(self.rows.shape[0]) + len(self.tail)
+
+    def __getitem__(self, i: int) -> dict:
+        nb = int(self.rows.shape[0])
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.base[int(self.rows[i])] if i < nb else self.tail[i - nb]
+
+    def __iter__(self) -> Iterator[dict]:
+        for r in self.rows:
+            yield self.base[int(r)]
+        yield from self.tail
+
+    def select(self, keep: np.ndarray) -> "SegmentedMeta":
+        nb = int(self.rows.shape[0])
+        split = int(np.searchsorted(keep, nb))
+        return SegmentedMeta(self.base, self.rows[keep[:split]], [self.tail[int(j) - nb] for j in keep[split:]])
+
+    def append(self, metas: List[dict]) -> "SegmentedMeta":
+        return SegmentedMeta(self.base, self.rows, self.tail + metas) if metas else self
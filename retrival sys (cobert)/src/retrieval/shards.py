@@ -0,0 +1,199 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Any, List, Optional, Tuple
+import multiprocessing as mp
+import os
+import threading
+import numpy as np
+from config import settings
+from retrieval.scan import blocked_topk, blocked_topk_many, top_k
+
+# One BLAS thread per shard process; the shards are the parallelism
+_SINGLE_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # The parent owns the segment; workers must not unlink it when they exit
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+def _serve(conn: Any) -> None:
+    shm = None
+    mat = None
+    lo = 0
+    version = None
+    while True:
+        msg = conn.recv()
+        op = msg[0]
+        try:
+            if op == "attach":
+                _, name, shape, lo, hi, version = msg
+                if shm is not None:
+                    mat = None
+                    shm.close()
+                shm = _attach(name)
+                mat = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)[lo:hi]
+                conn.send(("ok", version))
+            elif op in ("search", "search_many"):
+                _, ver, q, k = msg
+                if ver != version or mat is None:
+                    conn.send(("stale", version))
+                elif op == "search":
+                    idx, sims = blocked_topk(mat, q, k)
+                    conn.send(("ok", idx + lo, sims))
+                else:
+                    idx, sims = blocked_topk_many(mat, q, k)
+                    conn.send(("ok", idx + lo, sims))
+            elif op == "close":
+                break
+        except Exception as exc:
+            conn.send(("error", repr(exc)))
+    mat = None
+    if shm is not None:
+        shm.close()
+    conn.close()
+
+
+class _Shard:
+    # Requests on one pipe are answered in order, so pending futures form a FIFO
+    def __init__(self, ctx: Any, index: int):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_serve, args=(child,), name=f"corpus-shard-{index}", daemon=True)
+        self.process.start()
+        child.close()
+        self._pending: deque = deque()
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, name=f"corpus-shard-{index}-reader", daemon=True)
+        self._reader.start()
+
+    def request(self, *msg: Any) -> Future:
+        fut: Future = Future()
+        with self._send_lock:
+            self._pending.append(fut)
+            try:
+                self.conn.send(msg)
+            except Exception:
+                # nothing was sent, so no reply will pop this future
+                self._pending.pop()
+                raise
+        return fut
+
+    def _read(self) -> None:
+        while True:
+            try:
+                reply = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            fut = self._pending.popleft()
+            if reply[0] == "error":
+                fut.set_exception(RuntimeError(f"Shard worker failed: {reply[1]}"))
+            else:
+                fut.set_result(reply)
+        while self._pending:
+            self._pending.popleft().set_exception(RuntimeError("Shard worker exited"))
+
+    def close(self) -> None:
+        try:
+            with self._send_lock:
+                self.conn.send(("close",))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class ShardPool:
+    """Scatter-gather exact search over a corpus split across N worker processes.
+
+    `load()` copies a snapshot's matrix into one shared-memory segment and gives
+    each worker a contiguous row range of it. A query is broadcast to all
+    workers. Each worker streams its range with `blocked_topk`, and the
+    per-shard top-k lists are merged into the global top-k. Requests carry the
+    snapshot version; if the workers are serving another version, the search
+    returns None and the caller scans locally.
+    """
+
+    def __init__(self, shards: Optional[int] = None):
+        self.size = max(1, shards or settings.search_shards or os.cpu_count() or 1)
+        ctx = mp.get_context("spawn")
+        saved = {name: os.environ.get(name) for name in _SINGLE_THREAD_ENV}
+        os.environ.update({name: "1" for name in _SINGLE_THREAD_ENV})
+        try:
+            self._shards = [_Shard(ctx, i) for i in range(self.size)]
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        self._lock = threading.Lock()
+        self._segment: shared_memory.SharedMemory | None = None
+        self.version: Optional[int] = None
+
+    def load(self, matrix: np.ndarray, version: int) -> None:
+        if self.version == version:
+            return
+        with self._lock:
+            if self.version == version:
+                return
+            n, dim = int(matrix.shape[0]), int(matrix.shape[1])
+            segment = shared_memory.SharedMemory(create=True, size=max(n * dim * 4, 1))
+            shared = np.ndarray((n, dim), dtype=np.float32, buffer=segment.buf)
+            for start in range(0, n, settings.scan_block_rows):
+                shared[start:start + settings.scan_block_rows] = matrix[start:start + settings.scan_block_rows]
+            del shared
+            bounds = np.linspace(0, n, self.size + 1).astype(int)
+            futures = [
+                shard.request("attach", segment.name, (n, dim), int(bounds[i]), int(bounds[i + 1]), version)
+                for i, shard in enumerate(self._shards)
+            ]
+            for fut in futures:
+                fut.result()
+            # Searches already queued on the old segment were answered before the attach
+            old, self._segment, self.version = self._segment, segment, version
+            if old is not None:
+                old.close()
+                old.unlink()
+
+    def search(self, q: np.ndarray, k: int, version: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        replies = self._scatter("search", version, np.asarray(q, dtype=np.float32), k)
+        if replies is None:
+            return None
+        return top_k(np.concatenate([r[1] for r in replies]), np.concatenate([r[2] for r in replies]), k)
+
+    def search_many(self, queries: np.ndarray, k: int, version: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        replies = self._scatter("search_many", version, np.asarray(queries, dtype=np.float32), k)
+        if replies is None:
+            return None
+        idx = np.concatenate([r[1] for r in replies], axis=1)
+        sims = np.concatenate([r[2] for r in replies], axis=1)
+        k = min(k, sims.shape[1])
+        if k < sims.shape[1]:
+            part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            idx, sims = np.take_along_axis(idx, part, axis=1), np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-sims, axis=1, kind="stable")
+        return np.take_along_axis(idx, order, axis=1), np.take_along_axis(sims, order, axis=1)
+
+    def _scatter(self, op: str, version: int, payload: np.ndarray, k: int) -> Optional[List[tuple]]:
+        futures = [shard.request(op, version, payload, k) for shard in self._shards]
+        replies = [fut.result() for fut in futures]
+        if any(r[0] != "ok" for r in replies):
+            return None
+        return replies
+
+    def close(self) -> None:
+        for shard in self._shards:
+            shard.close()
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment.unlink()
+                self._segment = None
+            self.version = None
@@ -0,0 +1,462 @@
+from __future__ import annotations
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional
+import contextlib
+import threading
+import time
+import numpy as np
+from config import settings
+from vendors.supabase_client import get_client
+from retrieval.vectors import DecodeStats, decode_vectors, l2_normalize
+from retrieval import cache as corpus_cache
+from retrieval.loader import BulkLoader
+from retrieval.segments import SegmentedMatrix, SegmentedMeta
+
+
+EMPTY_DIM = 768
+PAGE_SIZE = 1000
+QUANTIZED_MODES = ("int8", "pq", "pca", "binary")
+
+
+@dataclass(frozen=True)
+class CorpusSnapshot:
+    # L2-normalized float32 matrix, one row per entry in `meta`; after a delta sync, a SegmentedMatrix /
+    # SegmentedMeta over the previous one until the next compaction
+    matrix: np.ndarray
+    meta: List[dict]
+    version: int
+    # highest value of the sync column seen so far
+    watermark: Any = None
+    # HNSW graph (retrieval.hnsw.HnswIndex) and its label -> row in this snapshot (-1 if absent); set when
+    # SEARCH_MODE=hnsw. They are swapped together with the snapshot, so a search never pairs one graph with
+    # another snapshot's label map
+    ann: Any = None
+    ann_rows: Optional[np.ndarray] = None
+    # compressed first-pass codes (retrieval.quantize.QuantizedMatrix); set when SEARCH_MODE=int8/pq/pca/binary
+    quantized: Any = None
+
+    def __len__(self) -> int:
+        return int(self.matrix.shape[0])
+
+
+def _empty_matrix() -> np.ndarray:
+    return np.zeros((0, EMPTY_DIM), dtype=np.float32)
+
+
+def _sync_column() -> str:
+    return settings.sync_column or settings.id_column
+
+
+def _resident_bytes(snap: CorpusSnapshot | None) -> int:
+    if snap is None:
+        return 0
+    total = 0 if isinstance(snap.matrix, np.memmap) else int(snap.matrix.nbytes)
+    if snap.quantized is not None:
+        total += snap.quantized.nbytes
+    return total
+
+
+def _max_watermark(current: Any, value: Any) -> Any:
+    if value is None:
+        return current
+    if current is None or value > current:
+        return value
+    return current
+
+
+class CorpusStore:
+    """Process-wide resident copy of the documents table.
+
+    Snapshots are immutable; `refresh()` and `sync()` build a new one and swap
+    the reference, so a search in flight keeps scoring the snapshot it started with.
+    A delta sync only holds the changed rows in memory, on top of the previous
+    matrix; they are merged into a new cache generation every
+    SYNC_COMPACT_INTERVAL seconds (see `_publish`).
+    """
+
+    def __init__(self, client: Any = None):
+        self._client = client
+        self._lock = threading.Lock()
+        self._snapshot: CorpusSnapshot | None = None
+        self.loaded_from_cache = False
+        self._syncs = 0
+        self._last_sync_at: float | None = None
+        self._last_sync_changes = 0
+        self._last_error: str | None = None
+        self._compacted_at = time.monotonic()
+        # unfinished full load; the next rebuild resumes it instead of starting over
+        self._loader: BulkLoader | None = None
+        self._last_load: Dict[str, Any] | None = None
+        self._decode = DecodeStats()
+        self._stop = threading.Event()
+        self._sync_thread: threading.Thread | None = None
+        # SHARED_CORPUS: every process serves the published cache files and follows new generations
+        self._shared = settings.shared_corpus and bool(settings.embed_cache)
+        self._file_lock: Any = corpus_cache.CorpusLock() if self._shared else contextlib.nullcontext()
+        self._stamp: Any = None
+        self._next_poll = 0.0
+        # adopts generations published by other processes, off the search path
+        self._adopt_wanted = threading.Event()
+        self._adopter: threading.Thread | None = None
+        self._adopter_lock = threading.Lock()
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    @property
+    def version(self) -> int:
+        snap = self._snapshot
+        return snap.version if snap is not None else 0
+
+    def snapshot(self) -> CorpusSnapshot:
+        snap = self._snapshot
+        if snap is None:
+            with self._lock:
+                if self._snapshot is None:
+                    # shared: the first process builds and publishes, the others wait and attach
+                    with self._file_lock:
+                        self._snapshot = self._load_initial()
+                snap = self._snapshot
+        elif self._shared:
+            snap = self._follow()
+        return snap
+
+    def refresh(self) -> CorpusSnapshot:
+        with self._lock:
+            # the current snapshot keeps serving with its own graph while the new one is built
+            self._snapshot = self._publish(self._attach_index(self._build(version=self.version + 1)))
+            return self._snapshot
+
+    def save_cache(self) -> bool:
+        return self._persist(self.snapshot())
+
+    def _load_initial(self) -> CorpusSnapshot:
+        if settings.embed_cache:
+            cached = corpus_cache.load_corpus()
+            if cached is not None:
+                self.loaded_from_cache = True
+                snap = self._attach_index(self._from_cache(cached))
+                # Catch up with rows written after the cache, without holding up the caller
+                threading.Thread(target=self._catch_up, name="corpus-catch-up", daemon=True).start()
+                return snap
+        return self._publish(self._attach_index(self._build(version=1)))
+
+    def _from_cache(self, cached: tuple) -> CorpusSnapshot:
+        mat, meta, manifest = cached
+        self._stamp = corpus_cache.manifest_stamp()
+        snap = CorpusSnapshot(mat, meta, manifest["version"], manifest.get("watermark"))
+        if settings.search_mode == "hnsw":
+            from retrieval.hnsw import HnswIndex
+            snap = replace(snap, ann=HnswIndex.load(manifest["embeddings_sha256"]))
+        elif settings.search_mode in QUANTIZED_MODES:
+            from retrieval.quantize import QuantizedMatrix
+            loaded = QuantizedMatrix.load(settings.search_mode, manifest["embeddings_sha256"])
+            if loaded is not None and loaded.codes.shape[0] == len(snap):
+                snap = replace(snap, quantized=loaded)
+        return snap
+
+    def _follow(self) -> CorpusSnapshot:
+        # At most one manifest stat per SHARED_POLL seconds on the search path
+        now = time.monotonic()
+        if now < self._next_poll:
+            return self._snapshot
+        self._next_poll = now + settings.shared_poll
+        if corpus_cache.manifest_stamp() != self._stamp:
+            # Mapping the new files, loading its graph or codes and the label map take a while; the
+            # adopter thread does that and swaps the pointer, this search keeps the current snapshot
+            self._adopt_wanted.set()
+            if self._adopter is None or not self._adopter.is_alive():
+                with self._adopter_lock:
+                    if self._adopter is None or not self._adopter.is_alive():
+                        self._adopter = threading.Thread(target=self._adopt_loop, name="corpus-adopt", daemon=True)
+                        self._adopter.start()
+        return self._snapshot
+
+    def _adopt_loop(self) -> None:
+        while True:
+            self._adopt_wanted.wait()
+            self._adopt_wanted.clear()
+            try:
+                with self._lock:
+                    self._adopt()
+            except Exception as exc:
+                self._last_error = str(exc)
+                print(f"Corpus adopt failed: {exc}")
+
+    def _adopt(self) -> bool:
+        """Swap in a cache generation published by another process; caller holds self._lock."""
+        with self._file_lock:
+            stamp = corpus_cache.manifest_stamp()
+            if stamp is None or stamp == self._stamp:
+                return False
+            cached = corpus_cache.load_corpus()
+            if cached is None:
+                return False
+            self._snapshot = self._attach_index(self._from_cache(cached))
+            self._compacted_at = time.monotonic()
+            return True
+
+    def _attach_index(
+        self,
+        snap: CorpusSnapshot,
+        prev: CorpusSnapshot | None = None,
+        keep: np.ndarray | None = None,
+        fresh: np.ndarray | None = None,
+    ) -> CorpusSnapshot:
+        mode = settings.search_mode
+        if len(snap) == 0:
+            return snap
+        if mode == "hnsw":
+            index = snap.ann
+            if index is None:
+                from retrieval.hnsw import HnswIndex
+                index = HnswIndex.build(np.asarray(snap.matrix), snap.meta)
+            return replace(snap, ann=index, ann_rows=index.rows_for(snap.meta))
+        if mode in QUANTIZED_MODES and snap.quantized is None:
+            if prev is not None and prev.quantized is not None and keep is not None:
+                quantized = prev.quantized.extend(keep, fresh)
+            else:
+                from retrieval.quantize import QuantizedMatrix
+                quantized = QuantizedMatrix.build(mode, np.asarray(snap.matrix))
+            return replace(snap, quantized=quantized)
+        return snap
+
+    def _publish(self, snap: CorpusSnapshot, persist: bool = True) -> CorpusSnapshot:
+        """Write `snap` as a new cache generation (persist=True) and serve it from the written files where that
+        saves memory. Also the compaction of delta segments: without a cache they are merged in memory."""
+        if not persist:
+            return snap
+        self._compacted_at = time.monotonic()
+        segmented = isinstance(snap.matrix, SegmentedMatrix)
+        with self._file_lock:
+            if not self._persist(snap):
+                if segmented:
+                    return replace(snap, matrix=np.ascontiguousarray(np.asarray(snap.matrix)), meta=list(snap.meta))
+                return snap
+            if self._shared or segmented:
+                # Serve the published files rather than a private copy, like every other process
+                cached = corpus_cache.load_corpus(verify=False)
+                if cached is not None:
+                    self._stamp = corpus_cache.manifest_stamp()
+                    return replace(snap, matrix=cached[0], meta=cached[1])
+            if snap.quantized is not None:
+                # Full-precision rows are only read to re-score candidates; serve them from the page cache
+                snap = replace(snap, matrix=np.load(settings.embed_cache, mmap_mode="r"))
+        return snap
+
+    def _catch_up(self) -> None:
+        try:
+            self.sync()
+        except Exception as exc:
+            self._last_error = str(exc)
+            print(f"Corpus sync failed: {exc}")
+
+    def _persist(self, snap: CorpusSnapshot) -> bool:
+        if not settings.embed_cache:
+            return False
+        try:
+            with self._file_lock:
+                manifest = corpus_cache.save_corpus(snap.matrix, snap.meta, snap.version, snap.watermark)
+                if snap.ann is not None:
+                    snap.ann.save(manifest["embeddings_sha256"])
+                if snap.quantized is not None:
+                    snap.quantized.save(manifest["embeddings_sha256"])
+            return True
+        except Exception as exc:
+            print(f"Could not write corpus cache: {exc}")
+            return False
+
+    def sync(self) -> CorpusSnapshot:
+        """Apply rows changed since the current watermark; loads like `snapshot()` if nothing is resident yet."""
+        with self._lock:
+            base = self._snapshot
+            if base is None:
+                # same path as the first search: mmap the cache if there is one, and in shared mode
+                # attach to what another process publishes instead of loading the table again
+                with self._file_lock:
+                    self._snapshot = self._load_initial()
+                return self._snapshot
+            if self._shared and self._adopt():
+                # start from whatever another process already published
+                base = self._snapshot
+            rows = self._fetch_rows(since=base.watermark)
+            removed: set = set()
+            self._syncs += 1
+            if settings.sync_prune_every > 0 and self._syncs % settings.sync_prune_every == 0:
+                live = self._fetch_ids()
+                removed = {m["id"] for m in base.meta if m["id"] not in live}
+            self._last_sync_at = time.time()
+            self._last_sync_changes = len(rows) + len(removed)
+            due = time.monotonic() - self._compacted_at >= settings.sync_compact_interval
+            if rows or removed:
+                self._snapshot = self._apply_delta(base, rows, removed, compact=due or bool(removed))
+            elif due and isinstance(base.matrix, SegmentedMatrix):
+                self._snapshot = self._publish(base)
+            return self._snapshot
+
+    def sync_status(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        return {
+            "version": self.version,
+            "documents": len(snap) if snap is not None else 0,
+            "watermark": snap.watermark if snap is not None else None,
+            "syncs": self._syncs,
+            "last_sync_at": self._last_sync_at,
+            "last_sync_changes": self._last_sync_changes,
+            "last_error": self._last_error,
+            "background": self._sync_thread is not None and self._sync_thread.is_alive(),
+            "loaded_from_cache": self.loaded_from_cache,
+            "resident_bytes": _resident_bytes(snap),
+            "shared": self._shared,
+            "last_load": self._last_load,
+            "decode": self._decode.as_dict(),
+        }
+
+    def start_background_sync(self, interval: Optional[float] = None) -> bool:
+        interval = settings.sync_interval if interval is None else interval
+        if interval <= 0:
+            return False
+        if self._sync_thread is not None and self._sync_thread.is_alive():
+            return True
+        self._stop.clear()
+        self._sync_thread = threading.Thread(target=self._sync_loop, args=(interval,), name="corpus-sync", daemon=True)
+        self._sync_thread.start()
+        return True
+
+    def stop_background_sync(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join(timeout)
+            self._sync_thread = None
+
+    def _sync_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.sync()
+                self._last_error = None
+            except Exception as exc:
+                self._last_error = str(exc)
+                print(f"Corpus sync failed: {exc}")
+
+    def _columns(self) -> str:
+        cols = [settings.id_column, settings.content_column, settings.vector_column]
+        for extra in (_sync_column(), settings.deleted_column):
+            if extra and extra not in cols:
+                cols.append(extra)
+        return ",".join(cols)
+
+    def _fetch_rows(self, since: Any = None) -> list[dict]:
+        if since is None:
+            return self._load_all()
+        rows: list[dict] = []
+        offset = 0
+        while True:
+            query = self.client.table(settings.table_name).select(self._columns())
+            query = query.gt(_sync_column(), since).order(_sync_column())
+            resp = query.range(offset, offset + PAGE_SIZE - 1).execute()
+            batch = resp.data or []
+            rows.extend(batch)
+            if len(batch) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+        return rows
+
+    def _load_all(self) -> list[dict]:
+        loader = self._loader
+        if loader is None or loader.columns != self._columns():
+            loader = self._loader = BulkLoader(self.client, self._columns())
+        rows = loader.load()
+        self._loader = None
+        self._last_load = loader.stats.as_dict()
+        print(
+            f"Loaded {loader.stats.rows} rows in {loader.stats.seconds:.2f} s "
+            f"({loader.stats.rows_per_s:.0f} rows/s, {loader.workers} workers)"
+        )
+        return rows
+
+    def _fetch_ids(self) -> set:
+        rows = BulkLoader(self.client, settings.id_column).load()
+        return {r.get(settings.id_column) for r in rows}
+
+    def _parse_rows(self, rows: list[dict], dim: Optional[int] = None) -> tuple[np.ndarray, list[dict], set, Any]:
+        # -> (normalized vectors, metas, ids to drop, watermark of this batch)
+        values: list[Any] = []
+        candidates: list[dict] = []
+        dropped: set = set()
+        watermark: Any = None
+        for r in rows:
+            rid = r.get(settings.id_column)
+            watermark = _max_watermark(watermark, r.get(_sync_column()))
+            if settings.deleted_column and r.get(settings.deleted_column):
+                dropped.add(rid)
+                continue
+            values.append(r.get(settings.vector_column))
+            candidates.append({
+                "id": rid,
+                "content": r.get(settings.content_column, ""),
+            })
+        mat, ok, stats = decode_vectors(values, dim=dim)
+        self._decode.merge(stats)
+        if stats.skipped:
+            print(f"Skipped {stats.skipped} of {len(values)} embeddings: {stats.as_dict()}")
+        metas = [m for m, good in zip(candidates, ok) if good]
+        dropped.update(m["id"] for m, good in zip(candidates, ok) if not good)
+        if mat.shape[0]:
+            mat = l2_normalize(mat).astype(np.float32, copy=False)
+        return mat, metas, dropped, watermark
+
+    def _build(self, version: int) -> CorpusSnapshot:
+        mat, metas, _, watermark = self._parse_rows(self._fetch_rows())
+        if not metas:
+            # No usable vectors parsed
+            return CorpusSnapshot(_empty_matrix(), [], version, watermark)
+        return CorpusSnapshot(mat, metas, version, watermark)
+
+    def _apply_delta(self, base: CorpusSnapshot, rows: list[dict], removed: set, compact: bool = False) -> CorpusSnapshot:
+        # A vector of the wrong width cannot join the resident matrix
+        fresh, metas, dropped, watermark = self._parse_rows(rows, dim=base.matrix.shape[1] if len(base) else None)
+        # Updated rows are dropped from their old position and appended again
+        replaced = removed | dropped | {m["id"] for m in metas}
+        keep = np.fromiter(
+            (i for i, m in enumerate(base.meta) if m["id"] not in replaced), dtype=np.int64
+        )
+        fresh_ids = [m["id"] for m in metas]
+        if not metas:
+            fresh = _empty_matrix()
+        if keep.size:
+            # Only the changed rows are copied; the kept ones stay where they are (usually the mmapped cache)
+            mat: Any = SegmentedMatrix.over(base.matrix).select(keep).append(fresh)
+            meta: Any = SegmentedMeta.over(base.meta).select(keep).append(metas)
+        else:
+            mat = fresh if metas else _empty_matrix()
+            meta = metas
+        if base.ann is not None:
+            # Updated in place: labels are stable per document id, so the current snapshot's label map stays
+            # valid (new labels fall outside it, deleted ones are filtered by the graph)
+            base.ann.remove((removed | dropped) - set(fresh_ids))
+            base.ann.upsert(fresh_ids, fresh)
+        snap = CorpusSnapshot(
+            mat,
+            meta,
+            base.version + 1,
+            _max_watermark(base.watermark, watermark),
+            ann=base.ann,
+        )
+        return self._publish(self._attach_index(snap, prev=base, keep=keep, fresh=fresh), persist=compact)
+
+
+_store: CorpusStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> CorpusStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CorpusStore()
+                _store.start_background_sync()
+    return _store
@@ -0,0 +1,154 @@
+from __future__ import annotations
+from collections import Counter
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import struct
+import warnings
+import numpy as np
+
+
+def l2_normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
+    return x / norms
+
+
+# pgvector binary wire format (vector_send): uint16 dim, uint16 unused, dim big-endian float4
+_BINARY_HEADER = struct.Struct(">HH")
+_BINARY_FLOAT = np.dtype(">f4")
+
+
+@dataclass
+class DecodeStats:
+    decoded: int = 0
+    # NULL / empty embedding
+    missing: int = 0
+    # unparseable text, bad binary length, unsupported type
+    malformed: int = 0
+    # parsed fine but not the page's (or the corpus') dimension
+    wrong_dim: int = 0
+    non_finite: int = 0
+
+    @property
+    def skipped(self) -> int:
+        return self.missing + self.malformed + self.wrong_dim + self.non_finite
+
+    def merge(self, other: "DecodeStats") -> None:
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+    def as_dict(self) -> Dict[str, int]:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+def _parse_text(text: str) -> np.ndarray:
+    # fromstring only warns on trailing garbage in older numpy; make it a ValueError everywhere
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(text, dtype=np.float64, sep=",")
+        except DeprecationWarning as exc:
+            raise ValueError(str(exc)) from exc
+
+
+def _text_body(s: str) -> Optional[str]:
+    # pgvector "[1,2,3]" / JSON array, or Postgres array "{1,2,3}"
+    s = s.strip()
+    if len(s) >= 2 and ((s[0] == "[" and s[-1] == "]") or (s[0] == "{" and s[-1] == "}")):
+        return s[1:-1]
+    return None
+
+
+def decode_vectors(values: Sequence[Any], dim: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, DecodeStats]:
+    """Decode a page of embedding column values into one float32 (n_ok, dim) array.
+
+    Accepts lists / ndarrays, pgvector or JSON text ("[..]"), Postgres array
+    text ("{..}") and pgvector's binary format (bytes, e.g. from a psycopg binary
+    cursor). All text rows of the page are parsed in a single numpy call. `dim`
+    defaults to the most common width among the decodable rows (the first seen
+    on a tie); rows of any other width count as wrong_dim. Returns
+    (matrix, ok, stats), where `ok` is a mask over `values`.
+    """
+    n = len(values)
+    stats = DecodeStats()
+    ok = np.zeros(n, dtype=bool)
+    # (position, kind, payload, width) of every row that looks decodable
+    plan: List[Tuple[int, str, Any, int]] = []
+    for i, value in enumerate(values):
+        if value is None:
+            stats.missing += 1
+            continue
+        if isinstance(value, str):
+            body = _text_body(value)
+            if body is None:
+                stats.malformed += 1
+            elif not body.strip():
+                stats.missing += 1
+            else:
+                plan.append((i, "text", body, body.count(",") + 1))
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            raw = bytes(value)
+            if len(raw) < _BINARY_HEADER.size:
+                stats.malformed += 1
+                continue
+            width = _BINARY_HEADER.unpack_from(raw)[0]
+            if len(raw) != _BINARY_HEADER.size + 4 * width:
+                stats.malformed += 1
+            elif width == 0:
+                stats.missing += 1
+            else:
+                plan.append((i, "binary", raw, width))
+        elif isinstance(value, (list, tuple, np.ndarray)):
+            if len(value) == 0:
+                stats.missing += 1
+            else:
+                plan.append((i, "array", value, len(value)))
+        else:
+            stats.malformed += 1
+
+    if dim is None:
+        # the majority width, so one short or stale row cannot turn every other row into wrong_dim
+        dim = Counter(p[3] for p in plan).most_common(1)[0][0] if plan else 0
+    rows = [p for p in plan if p[3] == dim]
+    stats.wrong_dim += len(plan) - len(rows)
+
+    out = np.empty((len(rows), dim), dtype=np.float32)
+    good = np.zeros(len(rows), dtype=bool)
+    text = [j for j, p in enumerate(rows) if p[1] == "text"]
+    if text:
+        try:
+            flat = _parse_text(",".join(rows[j][2] for j in text))
+        except ValueError:
+            flat = None
+        if flat is not None and flat.size == len(text) * dim:
+            out[text] = flat.reshape(len(text), dim)
+            good[text] = True
+        else:
+            # Something in the page is malformed: fall back to row by row to find it
+            for j in text:
+                try:
+                    vec = _parse_text(rows[j][2])
+                except ValueError:
+                    continue
+                if vec.size == dim:
+                    out[j] = vec
+                    good[j] = True
+    for j, (_, kind, payload, _) in enumerate(rows):
+        if kind == "binary":
+            out[j] = np.frombuffer(payload, dtype=_BINARY_FLOAT, count=dim, offset=_BINARY_HEADER.size)
+            good[j] = True
+        elif kind == "array":
+            try:
+                out[j] = np.asarray(payload, dtype=np.float32)
+                good[j] = True
+            except (TypeError, ValueError):
+                pass
+    stats.malformed += int((~good).sum())
+
+    finite = np.isfinite(out).all(axis=1)
+    stats.non_finite += int((good & ~finite).sum())
+    good &= finite
+    stats.decoded = int(good.sum())
+    if not good.all():
+        out = out[good]
+    ok[[p[0] for p, g in zip(rows, good) if g]] = True
+    return out, ok, stats
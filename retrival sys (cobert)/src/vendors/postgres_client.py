@@ -0,0 +1,35 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Iterator
+import threading
+from psycopg2.pool import ThreadedConnectionPool
+from pgvector.psycopg2 import register_vector
+from config import settings
+
+_pool: ThreadedConnectionPool | None = None
+_pool_lock = threading.Lock()
+_registered: set[int] = set()
+
+
+def get_pool() -> ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if not settings.database_url:
+                    raise RuntimeError("DATABASE_URL must be set for the pgvector search backend")
+                _pool = ThreadedConnectionPool(1, max(1, settings.pg_pool_size), settings.database_url)
+    return _pool
+
+
+@contextmanager
+def connection() -> Iterator:
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        if id(conn) not in _registered:
+            register_vector(conn)
+            _registered.add(id(conn))
+        yield conn
+    finally:
+        pool.putconn(conn)